@@ -22,79 +22,187 @@ import tempfile
 import getpass
 import re
 import abc
-import yaml
 from abc import *
 from functools import reduce
 from shutil import copy2
+from bag_ecd.generator_index import generator_index
+from bag_ecd.generator_finder import generator_finder
+from bag_ecd.yaml_cache import load_yaml
 
 
-class bag_startup(metaclass=abc.ABCMeta):
-    '''Defines the common attributes of the system environment
+class cached_classattr():
+    '''
+    Class attribute that is computed on first access and cached to the class
+    it was defined in. Used by the lazy initialization mode of bag_startup.
+    Assigning the attribute (e.g. bag_design.initlog) replaces the cached value.
+
+    Parameters:
+
+    func : Callable[[type], Any]
+        Function computing the value. Called with the class the attribute was
+        defined in.
 
     '''
-    #Solve for the BAGHOME
-    BAGHOME=os.path.realpath(__file__)
-    for i in range(3):
-        BAGHOME=os.path.dirname(BAGHOME)
-    print("Home of BAG is %s" %(BAGHOME))
-    #This is for bag control through shell txtfile if needed
-    CONFIGFILE=BAGHOME+'/BAG.config'
+    def __init__(self, func):
+        self._func = func
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        self._owner = owner
+        self._name = name
 
-    print("Config file  of BAG is %s" %(CONFIGFILE))
+    def __get__(self, instance, owner=None):
+        value = self._func(self._owner)
+        setattr(self._owner, self._name, value)
+        return value
 
-    sys.path.append(os.environ['BAG_FRAMEWORK'])
-    sys.path.append(os.environ['BAG_TECH_CONFIG_DIR'])
-    sys.path.append(os.path.join(os.environ['BAG_TECH_CONFIG_DIR'], 'BAG_prim/layouts'))
-    sys.path.append(os.path.join(os.environ['BAG_WORK_DIR'], 'BAG2_TEMPLATES_EC'))
+def _add_framework_paths():
+    '''
+    Add the BAG framework and technology packages to system path.
+    '''
+    for path in [ os.environ['BAG_FRAMEWORK'],
+            os.environ['BAG_TECH_CONFIG_DIR'],
+            os.path.join(os.environ['BAG_TECH_CONFIG_DIR'], 'BAG_prim/layouts'),
+            os.path.join(os.environ['BAG_WORK_DIR'], 'BAG2_TEMPLATES_EC') ]:
+        if path not in sys.path:
+            sys.path.append(path)
 
-    # Lets read the BAG config pyhhon dictionary
+def _read_bag_config(baghome):
+    '''
+    Read the BAG config python dictionary from baghome/bag_config.yaml
+    '''
     # Im quite sure that these can be accessed through bag class
-    with open(BAGHOME+'/bag_config.yaml', 'r') as content:
-        bag_config = yaml.load(content, Loader=yaml.FullLoader)
+    # Parsed content is cached, see yaml_cache.py
+    return load_yaml(baghome+'/bag_config.yaml')
 
+def _register_generators(baghome, cmpath):
+    '''
+    Register all BAG generator python modules to the import system.
 
-    #Appending all BAG generator python modules to system path 
+    Returns:
+    -------
+    generators : List[str]
+        Directories of the discovered generator packages
+    '''
     # Strategy: Find all files with path "$BAG_WORK_DIR/module_name/module_name/__init__.py",
     # append to list, set substract sys.path from GENERATORS to ensure that nothing is added
     # twice and to ensure uniqueness
-    root=BAGHOME
-    GENERATORS=[]
-    for item in os.listdir(root):
-        if not os.path.isfile(os.path.join(root, item)):
-            if os.path.isfile(os.path.join(root, item, item, '__init__.py')):
-                GENERATORS.append(os.path.join(BAGHOME,item)) 
-    GENERATORS=list(set(GENERATORS) - set(sys.path))
-    
+    # The search results are cached in a persistent index, see generator_index.py
+    generators=generator_index(baghome).scan()
+    generators=list(set(generators) - set(sys.path))
+
+    # Generators are imported through a meta path finder mapping the package name to
+    # its location, see generator_finder.py. Set BAG_ECD_SYSPATH=1 to append the
+    # generator directories to sys.path instead.
+    use_syspath=os.environ.get('BAG_ECD_SYSPATH', '0') == '1'
+    if not use_syspath:
+        finder=generator_finder.install()
+
     # To make BAG work from SyDeKick: do not add gen to path if there is an entity with same name (this shouldn't be the case anyway)
-    # If CMPATH is not BAGHOME, then we are running from SDK.
-    currdir=os.getcwd()
-    CMPATH=os.path.commonpath([currdir, BAGHOME])
-    MODULELIST=[path.split('/')[-1] for path in sys.path] # List modules already in path
-    for path in GENERATORS:
+    # If cmpath is not baghome, then we are running from SDK.
+    modulelist={path.split('/')[-1] for path in sys.path} # Set of modules already in path
+    for path in generators:
+        generatorname=path.split('/')[-1]
         if not path.endswith('_gen'):
-            generatorname=path.split('/')[-1]
             warning="WARN: Thou shalt name thy generator python package %s_gen or eventually it must be merged to TheSyDeKick Entity!" %(generatorname) 
             print(warning)
 
-        if CMPATH==BAGHOME: # We are running generators from BAG side
-            print("Adding %s to system path\n" %(path))
-            sys.path.append(path)
-        else: # We are running generators from SDK side
-            if path not in MODULELIST:
+        # We are running generators from BAG side, or there is no entity with the same name
+        if cmpath==baghome or generatorname not in modulelist:
+            if use_syspath:
                 print("Adding %s to system path\n" %(path))
                 sys.path.append(path)
             else:
-                print("WARN: module %s already in path! Omitting!" % (path.split('/')[-1]))
+                if finder.add(path):
+                    print("Adding %s to generator import path\n" %(path))
+                else:
+                    print("WARN: module %s already exists in %s! Omitting!" % (generatorname, finder.shadowed[generatorname]))
+        else: # We are running generators from SDK side
+            print("WARN: module %s already in path! Omitting!" % (generatorname))
+    return generators
 
-    #Default logfile. Override with initlog if you want something else
-    #/tmp/TheSDK_randomstr_uname_YYYYMMDDHHMM.log
-    logfile="/tmp/BAG_" + os.path.basename(tempfile.mkstemp()[1])+"_"+getpass.getuser()+"_"+time.strftime("%Y%m%d%H%M")+".log"
+def _default_logfile():
+    '''
+    Default logfile /tmp/BAG_randomstr_uname_YYYYMMDDHHMM.log
+    '''
+    # Random string is taken from a temporary file, which is closed and removed right away
+    fid, tmpfile=tempfile.mkstemp()
+    os.close(fid)
+    os.remove(tmpfile)
+    logfile="/tmp/BAG_" + os.path.basename(tmpfile)+"_"+getpass.getuser()+"_"+time.strftime("%Y%m%d%H%M")+".log"
     if os.path.isfile(logfile):
         os.remove(logfile)
     print("Setting default logfile %s" %(logfile))
+    return logfile
+
+
+class bag_startup(metaclass=abc.ABCMeta):
+    '''Defines the common attributes of the system environment
+
+    By default, the environment is set up when this package is imported.
+    If environment variable BAG_ECD_LAZY=1, the config file parsing, generator
+    registration and logfile creation are deferred to the first access of 
+    bag_config, GENERATORS and logfile, respectively. System path is set up
+    by init_framework, which is called by the modules importing BAG, and the
+    generators are registered by init_environment, called by bag_design.
+
+    '''
+    LAZY=os.environ.get('BAG_ECD_LAZY', '0') == '1'
+
+    #Solve for the BAGHOME
+    BAGHOME=os.path.realpath(__file__)
+    for i in range(3):
+        BAGHOME=os.path.dirname(BAGHOME)
+    #This is for bag control through shell txtfile if needed
+    CONFIGFILE=BAGHOME+'/BAG.config'
+
+    # If CMPATH is not BAGHOME, then we are running from SDK.
+    currdir=os.getcwd()
+    CMPATH=os.path.commonpath([currdir, BAGHOME])
 
-    #Do not create the logfile here
-    #----logfile stuff ends here
+    if LAZY:
+        bag_config=cached_classattr(lambda cls: _read_bag_config(cls.BAGHOME))
+        GENERATORS=cached_classattr(lambda cls: _register_generators(cls.BAGHOME, cls.CMPATH))
+        #Default logfile. Override with initlog if you want something else
+        logfile=cached_classattr(lambda cls: _default_logfile())
+    else:
+        print("Home of BAG is %s" %(BAGHOME))
+        print("Config file  of BAG is %s" %(CONFIGFILE))
+        _add_framework_paths()
+
+        # Lets read the BAG config pyhhon dictionary
+        bag_config=_read_bag_config(BAGHOME)
+
+        #Registering all BAG generator python modules to the import system
+        GENERATORS=_register_generators(BAGHOME, CMPATH)
+
+        #Default logfile. Override with initlog if you want something else
+        logfile=_default_logfile()
+
+        #Do not create the logfile here
+        #----logfile stuff ends here
+
+    @staticmethod
+    def init_framework():
+        '''
+        Add the BAG framework and technology packages to system path, so that
+        bag can be imported. Does not register the generators.
+        '''
+        _add_framework_paths()
+
+    @classmethod
+    def init_environment(cls):
+        '''
+        Add the BAG framework to system path and register the generators.
+        Does nothing if this is already done.
+
+        Returns:
+        -------
+        generators : List[str]
+            Directories of the registered generator packages
+        '''
+        _add_framework_paths()
+        return cls.GENERATORS
 
     # Parse the global parameters from a BAG.config to a dict
     # Delete parameter list as not needed any more
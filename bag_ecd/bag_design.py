@@ -13,14 +13,32 @@ import abc
 from abc import *
 from shutil import copy2
 import re
+import multiprocessing
+import threading
+import importlib
 
 from bag_ecd import bag_startup 
+bag_startup.init_environment()
+from bag_ecd.log_sink import log_sink
+from bag_ecd.fingerprint import stable_hash, file_digest, source_files, canonical
+from bag_ecd.grid_cache import grid_cache
+from bag_ecd.session_pool import session_pool
+from bag_ecd.profiling import phase_tracer, null_phase
+from bag_ecd.library_manifest import find_library, library_state
+from bag_ecd.offline_backend import offline_backend
+from bag_ecd.propagation import propagation_engine
+from bag_ecd.pipeline import ordered_pipeline
+from bag_ecd.param_store import param_store
 
 import json
 import bag
 from bag.layout import RoutingGrid, TemplateDB
 from BAG_technology_definition import BAG_technology_definition 
-import pdb
+
+#Message types of print_log in increasing severity
+LOGTYPES={ 'D' : "DEBUG at", 'I' : "INFO at ", 'W' : "WARNING! at", 'E' : "ERROR! at", 'F' : "FATAL ERROR! at" }
+LOGLEVELS={ key : level for level, key in enumerate(LOGTYPES) }
+
 class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
 
     @property
@@ -120,17 +138,103 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
     #No setter, no deleter.
    
 
+    @property
+    def bag_endpoint(self):
+        '''
+        Keyword arguments of bag.BagProject defining the session to use, e.g. {'port' : 5555}.
+        Default : {}, the project configured by the environment.
+        '''
+        if not hasattr(self, '_bag_endpoint'):
+            self._bag_endpoint={}
+        return self._bag_endpoint
+    @bag_endpoint.setter
+    def bag_endpoint(self, val):
+        self._bag_endpoint=val
+
+    @property
+    def backend(self):
+        '''
+        Backend implementing the designs : 'virtuoso' or 'offline'.
+        'offline' records layouts and schematics to offline_dir instead of 
+        writing them to Virtuoso, see offline_backend.py.
+        Default : environment variable BAG_ECD_BACKEND or 'virtuoso'
+        '''
+        if not hasattr(self, '_backend'):
+            self._backend=os.environ.get('BAG_ECD_BACKEND', 'virtuoso')
+            if self._backend not in ('virtuoso', 'offline'):
+                self.print_log(type='F', msg='Unknown backend %s in BAG_ECD_BACKEND' % (self._backend))
+        return self._backend
+    @backend.setter
+    def backend(self, val):
+        if val not in ('virtuoso', 'offline'):
+            self.print_log(type='F', msg='Unknown backend %s' % (val))
+        self._backend=val
+
+    @property
+    def offline_dir(self):
+        '''
+        Database directory of the offline backend.
+        Default : environment variable BAG_ECD_OFFLINE_DIR or BAGHOME/offline_db
+        '''
+        if not hasattr(self, '_offline_dir'):
+            self._offline_dir=os.environ.get('BAG_ECD_OFFLINE_DIR', os.path.join(self.BAGHOME, 'offline_db'))
+        return self._offline_dir
+    @offline_dir.setter
+    def offline_dir(self, val):
+        self._offline_dir=val
+
+    @property
+    def use_cybagoa(self):
+        '''
+        Write layouts to OpenAccess directly with cybagoa.
+        Default : True, False for the offline backend
+        '''
+        if not hasattr(self, '_use_cybagoa'):
+            return self.backend != 'offline'
+        return self._use_cybagoa
+    @use_cybagoa.setter
+    def use_cybagoa(self, val):
+        self._use_cybagoa=val
+
     @property
     def bag_project(self):
         '''
         Property that  initializes/returns bag project.
+        The project is taken from the process-wide session pool (see session_pool.py),
+        so all generators with the same bag_endpoint share one session.
+        With the offline backend, the pool of offline_dir is used.
+        The session is health checked again by refresh_session at the start of
+        every generation.
         '''
         if hasattr(self,'_bag_project'):
             return self._bag_project
         else:
             self.print_log(msg='Initializing BagProject')
-            self._bag_project = bag.BagProject()
+            if self.backend == 'offline':
+                pool=offline_backend.get(self.offline_dir).pool
+            else:
+                pool=session_pool.pool
+            self._bag_project = pool.get(self.bag_endpoint)
+            self._bag_project_pool = pool
             return self._bag_project
+    @bag_project.setter
+    def bag_project(self, val):
+        self._bag_project=val
+        self.__dict__.pop('_bag_project_pool', None)
+
+    def refresh_session(self):
+        '''
+        Health check the pooled session of bag_project and replace it if it is not
+        usable anymore, e.g. after Virtuoso was restarted. Projects set by the user 
+        are not checked.
+        '''
+        pool=self.__dict__.get('_bag_project_pool')
+        if pool is None or '_bag_project' not in self.__dict__:
+            return
+        project=pool.get(self.bag_endpoint)
+        if project is not self._bag_project:
+            self.print_log(type='W', msg='BagProject session was lost, using a new session')
+            self._bag_project=project
 
     @property
     def template_library_name(self):
@@ -167,6 +271,47 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
             self._testbench_library_name= self.name+'_testbenches'
         return self._testbench_library_name
     
+    #Parameter information of layout generators, cached per layout class.
+    _layout_param_info={}
+
+    @classmethod
+    def layout_param_info(cls, layout):
+        '''
+        Parameter names and default values of a layout generator class.
+        get_params_info and get_default_param_values are called once per
+        layout class and process.
+
+        Returns:
+        -------
+        info : Tuple[Tuple[str], Dict[str, Any]]
+            Parameter names and default values
+        '''
+        info=bag_design._layout_param_info.get(layout)
+        if info is None:
+            info=(tuple(layout.get_params_info()), dict(layout.get_default_param_values()))
+            bag_design._layout_param_info[layout]=info
+        return info
+
+    def __setattr__(self, name, value):
+        '''
+        Marks the layout parameter dirty if an attribute with the same name is set.
+        See layout_params.
+        '''
+        object.__setattr__(self, name, value)
+        dirty=self.__dict__.get('_dirty_layout_params')
+        if dirty is not None and name in self.__dict__['_layout_param_keys']:
+            dirty.add(name)
+        elif name=='layout':
+            self.invalidate_layout_params()
+
+    def invalidate_layout_params(self):
+        '''
+        Re-read all layout parameters from the attributes on the next access
+        of layout_params. Needed only if a parameter attribute changes without
+        being set, e.g. a property computed from other attributes.
+        '''
+        self.__dict__['_dirty_layout_params']=None
+
     @property
     def layout_params(self):
         '''
@@ -179,46 +324,50 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
             1. Loop over the layout parameters defined in layout generator (keys)
             2. __init__ of module must have corresponding property
             3. Set property as value for the key
+
+        The dictionary is built once. After that, only the parameters whose attributes
+        have been set are re-read. Use invalidate_layout_params to re-read all of them.
         '''
         if not hasattr(self, '_layout_params'):
             if hasattr(self, 'draw_params') and hasattr(self, 'sch_params'): # Old type generators, for backwards compatibility
                 self._layout_params={**self.sch_params, **self.draw_params}
+                self.invalidate_layout_params()
+                return self._layout_params
             elif not hasattr(self,'draw_params'): # New type of generator, no dictionaries in __init__.py
                 self._layout_params=dict()
-                for key in self.layout.get_params_info(): # This classmethod must exist in every layout generator
-                    # check if attribute is defined in __init__
-                    if hasattr(self, key):
-                        self._layout_params[key]=getattr(self, key)
-                    # if parameter was not define in __init__, it might have default value in layout.py
-                    elif key in self.layout.get_default_param_values().keys(): 
-                        self.print_log(msg="Attribute %s not defined in %s/__init__.py, but is given default value in layout generator" \
-                                % (key, type(self).__name__))
-                        self.print_log(msg="Consider defining it explicitly in __init__.py in order to provide access to paramter")
-                    # Parameter was not defined anywhere, raise error
-                    else:
-                        raise self.print_log(type='F',msg='Parameter %s defined in layout generator not defined in __init__ of %s or as an optional parameter!'\
-                                % (key, type(self).__name__))
-            return self._layout_params
-        else:
-            for key in self.layout.get_params_info(): # This classmethod must exist in every layout generator
+                self.invalidate_layout_params()
+        dirty=self.__dict__.get('_dirty_layout_params')
+        if dirty is None or dirty:
+            keys, defaults=self.layout_param_info(self.layout)
+            self.__dict__['_layout_param_keys']=frozenset(keys)
+            if dirty is None:
+                dirty=keys
+            if not hasattr(self, '_defaulted_layout_params'):
+                self._defaulted_layout_params=set()
+            for key in dirty: 
+                # check if attribute is defined in __init__
                 if hasattr(self, key):
                     self._layout_params[key]=getattr(self, key)
                 # if parameter was not define in __init__, it might have default value in layout.py
-                elif key in self.layout.get_default_param_values().keys(): 
-                    self.print_log(msg="Attribute %s not defined in %s/__init__.py, but is given default value in layout generator" \
-                            % (key, type(self).__name__))
-                    self.print_log(msg="Consider defining it explicitly in __init__.py in order to provide access to paramter")
+                elif key in defaults: 
+                    if key not in self._defaulted_layout_params:
+                        self._defaulted_layout_params.add(key)
+                        self.print_log(msg="Attribute %s not defined in %s/__init__.py, but is given default value in layout generator" \
+                                % (key, type(self).__name__))
+                        self.print_log(msg="Consider defining it explicitly in __init__.py in order to provide access to paramter")
                 # Parameter was not defined anywhere, raise error
                 else:
                     raise self.print_log(type='F',msg='Parameter %s defined in layout generator not defined in __init__ of %s or as an optional parameter!'\
                             % (key, type(self).__name__))
-            return self._layout_params
+            self.__dict__['_dirty_layout_params']=set()
+        return self._layout_params
     @layout_params.setter
     def layout_params(self, val):
         '''
         Setter for layout_params. Useful for setting parameters in dict form from the SDK.
         '''
         self._layout_params=val
+        self.invalidate_layout_params()
 
     @property
     def sch_params(self):
@@ -233,6 +382,28 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
     def sch_params(self, val):
         self._sch_params=val
 
+    @property
+    def layout_sch_params(self):
+        '''
+        Schematic parameters set to sch_params by the layout generator at the last
+        generation of this design, or read from its manifest if generation was skipped.
+        '''
+        if not hasattr(self, '_layout_sch_params'):
+            self._layout_sch_params={}
+        return self._layout_sch_params
+    @layout_sch_params.setter
+    def layout_sch_params(self, val):
+        self._layout_sch_params=val
+
+    def input_sch_params(self):
+        '''
+        Schematic parameters set by the user: sch_params without the values set by 
+        the layout generator (see layout_sch_params).
+        '''
+        layout=self.layout_sch_params
+        return { key : value for key, value in self.sch_params.items() 
+                if key not in layout or canonical(layout[key]) != canonical(value) }
+
     @property
     def sch_dummy_info(self): 
         '''Flavor of the transistors'''
@@ -243,22 +414,86 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
     def sch_dummy_info(self, val):
         self._sch_dummy_info=val
 
+    @property
+    def share_routing_grid(self):
+        ''' Use the process-wide routing grid cache. Default: True '''
+        if not hasattr(self, '_share_routing_grid'):
+            self._share_routing_grid=True
+        return self._share_routing_grid
+    @share_routing_grid.setter
+    def share_routing_grid(self, val):
+        self._share_routing_grid=val
+
     @property
     def routing_grid(self):
         ''' Defines the routing grid of this design
         uses grid_opts defined in class BAG_technology_definition.
         This practice garantees the designs to be track-compatible within the process.
+
+        Grids are shared by all generators of the process with the same technology
+        and grid_opts, see grid_cache.py. Set share_routing_grid=False for a private grid.
         '''
         if (not hasattr(self,'_routing_grid')):
-            self._routing_grid= RoutingGrid(self.bag_project.tech_info, self.grid_opts['layers'], 
+            factory=lambda: RoutingGrid(self.bag_project.tech_info, self.grid_opts['layers'], 
                 self.grid_opts['spaces'], 
                 self.grid_opts['widths'], 
                 self.grid_opts['bot_dir'], 
                 width_override=self.grid_opts['width_override'])
+            if self.share_routing_grid:
+                self._routing_grid=grid_cache.cache.get(self.bag_project.tech_info, self.grid_opts, factory)
+            else:
+                self._routing_grid=factory()
             return self._routing_grid
         else:
             return self._routing_grid
 
+    @property
+    def template_db(self):
+        ''' Template database of the implementation library, shared by all variants
+        generated with generate_many. Templates with equal parameters are created once.
+        '''
+        if (not hasattr(self,'_template_db')):
+            self._template_db=TemplateDB('template_libs.def', self.routing_grid, self.implementation_library_name, use_cybagoa=self.use_cybagoa)
+        return self._template_db
+    @template_db.setter
+    def template_db(self, val):
+        self._template_db=val
+
+    @property
+    def template_db_lock(self):
+        ''' Lock serializing the use of template_db by the stages of the generate_many pipeline '''
+        if (not hasattr(self,'_template_db_lock')):
+            self._template_db_lock=threading.RLock()
+        return self._template_db_lock
+
+    @property
+    def implementation_lock(self):
+        '''
+        Lock held while layouts and schematics are written to the implementation 
+        library. generate_parallel sets it to a lock shared by its worker processes.
+        Default : threading.RLock()
+        '''
+        if (not hasattr(self,'_implementation_lock')):
+            self._implementation_lock=threading.RLock()
+        return self._implementation_lock
+    @implementation_lock.setter
+    def implementation_lock(self, val):
+        self._implementation_lock=val
+
+    @property
+    def pipeline(self):
+        '''
+        Number of variants of generate_many that may wait for Virtuoso I/O while the 
+        templates of the following variants are computed. 0 disables the pipeline.
+        Default : environment variable BAG_ECD_PIPELINE or 0
+        '''
+        if not hasattr(self, '_pipeline'):
+            self._pipeline=int(os.environ.get('BAG_ECD_PIPELINE', 0))
+        return self._pipeline
+    @pipeline.setter
+    def pipeline(self, val):
+        self._pipeline=int(val)
+
     #Common method to propagate system parameters
     # Copied from thesdk class (https://github.com/TheSystemDevelopmentKit/thesdk)
     def copy_propval(self,*arg):
@@ -281,35 +516,100 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
         This is done in order to allow setting same parameter (e.g. transistor width) using a different name for
         top and lower level generators.
 
+        The aliases are resolved once per generator by the propagation engine of the 
+        hierarchy (see propagate), and the unresolved ones are reported at once
+        by generate.
+
         '''
-           
         if len(arg)>=2:
             self.parent=arg[0]
-            for i in range(len(self.proplist)):
-                # Check first that parameter has corresponding entry in aliases
-                if self.proplist[i] in self.aliases.keys():
-                    param_key=self.aliases[self.proplist[i]]
-                    if param_key=='aliases' or self.proplist[i]=='aliases': # DONT DO THIS!
-                        self.print_log(type='F', msg='Cannot set aliases via proplist!')
-                    if hasattr(self,param_key):
-                    #Its nice to see how things propagate
-                        if  hasattr(self.parent,self.proplist[i]):
-                            msg="Setting %s: %s to %s" %(self.__class__.__name__, self.proplist[i], getattr(self.parent,self.proplist[i]))
-                            self.print_log(type= 'I', msg=msg)
-                            setattr(self,param_key,getattr(self.parent,self.proplist[i]))
-                        else:
-                            self.print_log(type='W', msg='Parent generator %s doesn\'t define parameter %s! Omitting!' \
-                                    % (self.parent.__class__.__name__, self.proplist[i]))
-                    else:
-                        self.print_log(type='W', msg='%s doesn\'t define parameter %s! Omitting!' \
-                                % (self.__class__.__name__, param_key))
-                else:
-                    self.print_log(type='W', msg='Alias for key %s isn\'t defined in %s.aliases! Omitting!' \
-                            % (self.proplist[i],self.__class__.__name__))
+            # Children use the session of the parent
+            if '_bag_project' in self.parent.__dict__ and '_bag_project' not in self.__dict__:
+                self._bag_project=self.parent._bag_project
+                if '_bag_project_pool' in self.parent.__dict__:
+                    self._bag_project_pool=self.parent._bag_project_pool
+            engine=getattr(self.parent, 'propagation', None)
+            if not isinstance(engine, propagation_engine):
+                engine=self.propagation
+            self._propagation=engine
+            try:
+                targets=engine.register(self, self.parent)
+            except ValueError as e: # DONT DO THIS!
+                self.print_log(type='F', msg=str(e))
+            engine.apply(self)
+            self.print_log(type='D', msg='Propagated %s' % (', '.join('%s from %s.%s' 
+                % (key, source.__class__.__name__, attr) for key, source, attr in targets)))
+
+    @property
+    def propagation(self):
+        '''
+        Parameter propagation engine of the hierarchy of this generator, shared with
+        the parent. See propagation.py.
+        '''
+        if not hasattr(self, '_propagation'):
+            self._propagation=propagation_engine()
+        return self._propagation
+
+    def propagate(self, names=None):
+        '''
+        Copy the parameters of this generator to the generators below it in the hierarchy,
+        e.g. after changing them in the top-level generator. Parameters are copied down
+        the chains of aliases, parents before their children.
+
+        Parameters:
+        -------
+        names : Union[str, Iterable[str], None]
+            Names of the changed parameters in this generator. Default: all
+        '''
+        count=self.propagation.propagate(names, source=self)
+        self.print_log(msg='Propagated %d parameters from %s' % (count, self.__class__.__name__))
+        self.propagation_report()
+
+    def propagation_report(self):
+        '''
+        Log the aliases of the hierarchy that could not be resolved, if there are new ones.
+        '''
+        summary=self.propagation.summary(new=True)
+        if summary is not None:
+            self.print_log(type='W', msg=summary)
+
+    @property
+    def children(self):
+        '''
+        Sub-generators of this generator, e.g. the generators created with this 
+        generator as parent. Registered by copy_propval.
+        '''
+        return [ child for child in self.propagation.children(self) if isinstance(child, bag_design) ]
+
+    def dependency_graph(self):
+        '''
+        Generators of the hierarchy below and including this one, children before 
+        their parents. Each generator is listed once.
+
+        Returns:
+        -------
+        generators : List[bag_design]
+        '''
+        order=[]
+        seen=set()
+        stack=[ (self, False) ]
+        while stack:
+            node, expanded=stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+        return order
 
     #Class method for setting the logfile
     @classmethod
     def initlog(cls,*arg):
+        # Pending messages are written to the old logfile before it is changed
+        log_sink.sink.close(__class__.logfile)
         if len(arg) > 0:
             __class__.logfile=arg[0]
 
@@ -317,70 +617,86 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
             os.remove(__class__.logfile)
         typestr="INFO at "
         msg="Default logfile override. Inited logging in %s" %(__class__.logfile)
-        fid= open(__class__.logfile, 'a')
         print("%s %s  %s: %s" %(time.strftime("%H:%M:%S"),typestr, __class__.__name__ , msg))
-        fid.write("%s %s %s: %s\n" %(time.strftime("%H:%M:%S"),typestr, __class__.__name__ , msg))
-        fid.close()
+        log_sink.sink.register(__class__.logfile)
+        log_sink.sink.write(__class__.logfile, "%s %s %s: %s\n" %(time.strftime("%H:%M:%S"),typestr, __class__.__name__ , msg))
 
     @property
     def DEBUG(self):
-        ''' Global attribute to setup a debug mode True | Falsw '''
+        ''' Global attribute to setup a debug mode True | False '''
         if not hasattr(self,'_DEBUG'):
-            return 'False'
+            return False
         else:
             return self._DEBUG
     @DEBUG.setter
     def DEBUG(self,value):
         self._DEBUG=value
 
+    @property
+    def log_level(self):
+        ''' Lowest message type printed by print_log, one of 'D', 'I', 'W', 'E' or 'F'.
+        Messages below this level are discarded before they are formatted.
+        Default: 'D' '''
+        if not hasattr(self,'_log_level'):
+            self._log_level='D'
+        return self._log_level
+    @log_level.setter
+    def log_level(self,value):
+        if value not in LOGLEVELS:
+            self.print_log(type='E', msg='Unknown log level %s. Choose one of %s.' % (value, ', '.join(LOGLEVELS)))
+        else:
+            self._log_level=value
+
+    @property
+    def log_jsonl(self):
+        ''' File to write the log messages also as JSON lines with fields time, type, 
+        class and msg. Default: environment variable BAG_ECD_LOG_JSONL or None '''
+        if not hasattr(self,'_log_jsonl'):
+            self._log_jsonl=os.environ.get('BAG_ECD_LOG_JSONL', None)
+        return self._log_jsonl
+    @log_jsonl.setter
+    def log_jsonl(self,value):
+        self._log_jsonl=value
+
     #Method for logging
     #This is a method because it uses the logfile property
+    #Files are written in the background by log_sink
     def print_log(self,**kwargs):
-        if not os.path.isfile(bag_design.logfile):
+        type=kwargs.get('type', 'I')
+        # Discard before doing anything else
+        if type=='D' and not self.DEBUG:
+            return
+        if type in LOGLEVELS and LOGLEVELS[type] < LOGLEVELS[self.log_level]:
+            return
+        logfile=bag_design.logfile
+        if log_sink.sink.register(logfile) and not os.path.isfile(logfile):
             typestr="INFO at "
-            msg="Inited logging in %s" %(bag_design.logfile)
-            fid= open(bag_design.logfile, 'a')
+            msg="Inited logging in %s" %(logfile)
             print("%s %s bag_design: %s" %(time.strftime("%H:%M:%S"), typestr , msg))
-            fid.write("%s %s bag_design: %s\n" %(time.strftime("%H:%M:%S"), typestr, msg))
-            fid.close()
-        type=kwargs.get('type', 'I')
+            log_sink.sink.write(logfile, "%s %s bag_design: %s\n" %(time.strftime("%H:%M:%S"), typestr, msg))
         msg=kwargs.get('msg', 'Print this to the log')
-        if type== 'D':
-            if self.DEBUG:
-                typestr="DEBUG at"
-                print("%s %s %s: %s" %(time.strftime("%H:%M:%S"), typestr, self.__class__.__name__ , msg)) 
-                if hasattr(self,"logfile"):
-                    fid= open(bag_design.logfile, 'a')
-                    fid.write("%s %s %s: %s\n" %(time.strftime("%H:%M:%S"), typestr, self.__class__.__name__ , msg)) 
-            return
-        elif type== 'I':
-           typestr="INFO at "
-           print("%s %s %s: %s" %(time.strftime("%H:%M:%S"), typestr, self.__class__.__name__ , msg)) 
-        elif type=='W':
-           typestr="WARNING! at"
-           print("%s %s %s: %s" %(time.strftime("%H:%M:%S"), typestr, self.__class__.__name__ , msg)) 
-        elif type=='E':
-           typestr="ERROR! at"
-           print("%s %s %s: %s" %(time.strftime("%H:%M:%S"), typestr, self.__class__.__name__ , msg)) 
-
-        elif type=='F':
-           typestr="FATAL ERROR! at"
-           print("%s %s %s: %s" %(time.strftime("%H:%M:%S"), typestr, self.__class__.__name__ , msg)) 
-           print("Quitting due to fatal error in %s" %(self.__class__.__name__))
-           if hasattr(self,"logfile"):
-               fid= open(bag_design.logfile, 'a')
-               fid.write("%s Quitting due to fatal error in %s.\n" %( time.strftime("%H:%M:%S"), self.__class__.__name__))
-               fid.close()
-               quit()
+        if type in LOGTYPES:
+            typestr=LOGTYPES[type]
         else:
-           typestr="ERROR! at"
-           msg="Incorrect message type. Choose one of 'D', 'I', 'E' or 'F'."
-           print("%s %s %s: %s" %(time.strftime("%H:%M:%S"), typestr, self.__class__.__name__ , msg)) 
+            typestr="ERROR! at"
+            msg="Incorrect message type. Choose one of 'D', 'I', 'E' or 'F'."
+        timestr=time.strftime("%H:%M:%S")
+        line="%s %s %s: %s" %(timestr, typestr, self.__class__.__name__ , msg)
+        print(line) 
 
         #If logfile set, print also there 
         if hasattr(self,"logfile"):
-            fid= open(bag_design.logfile, 'a')
-            fid.write("%s %s %s: %s\n" %(time.strftime("%H:%M:%S"), typestr, self.__class__.__name__ , msg)) 
+            log_sink.sink.write(logfile, line+"\n")
+            if self.log_jsonl:
+                log_sink.sink.write(self.log_jsonl, json.dumps({'time' : time.time(), 
+                    'type' : type, 'class' : self.__class__.__name__, 'msg' : msg})+"\n")
+
+        if type=='F':
+            print("Quitting due to fatal error in %s" %(self.__class__.__name__))
+            if hasattr(self,"logfile"):
+                log_sink.sink.write(logfile, "%s Quitting due to fatal error in %s.\n" %(timestr, self.__class__.__name__))
+                log_sink.sink.flush()
+                quit()
 
     def param_dump(self, fname=''):
         '''
@@ -394,6 +710,99 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
             json.dump([self.layout_params], f, indent=4)
         return
 
+    def param_load(self, fname='', apply=False):
+        '''
+        Load generator parameters written by param_dump, or by generation to a 
+        param_store (file with .jsonl suffix, read line by line).
+        If filename was not given, load from the file of param_dump.
+
+        Parameters:
+        -------
+        fname : str
+            File to load from
+        apply : boolean
+            Set the parameters of the last entry as attributes of this generator.
+
+        Returns:
+        -------
+        params : List[Dict[str, Any]]
+            Layout parameters of the entries in file order
+        '''
+        if fname=='':
+            fname='./%s/%s_params.json' % (self.name, self.name)
+        if fname.endswith('.jsonl'):
+            params=[ record['layout_params'] for record in param_store(fname) ]
+        else:
+            with open(fname, 'r') as f:
+                params=json.load(f)
+        if apply and params:
+            for key, value in params[-1].items():
+                setattr(self, key, value)
+        return params
+
+    @property
+    def param_store(self):
+        '''
+        Store to which the parameters, results and timings of every generated cell
+        or variant are appended, see param_store.py. Set to a file name or param_store.
+        Default : environment variable BAG_ECD_PARAM_STORE or None (not stored)
+        '''
+        if not hasattr(self, '_param_store'):
+            fname=os.environ.get('BAG_ECD_PARAM_STORE')
+            self._param_store=param_store(fname) if fname else None
+        return self._param_store
+    @param_store.setter
+    def param_store(self, val):
+        if isinstance(val, str):
+            val=param_store(val)
+        self._param_store=val
+
+    def store_params(self, result):
+        '''
+        Append result of a generated cell (as in generate_many) to param_store, if any.
+        '''
+        store=self.param_store
+        if store is None:
+            return
+        try:
+            store.append(result['layout_params'], sch_params=result.get('sch_params'), cell=result['cell'],
+                    library=self.implementation_library_name, timings=result.get('timings'),
+                    generator=self.__class__.__name__)
+        except OSError as e:
+            self.print_log(type='W', msg='Could not write parameter store %s: %s' % (store.fname, e))
+
+    def import_manifest_file(self):
+        '''
+        Manifest recording the state of the template library at its previous import.
+        '''
+        return os.path.join(self.manifest_dir, 'imports', self.template_library_name+'.json')
+
+    def template_library_state(self):
+        '''
+        Hash of the state of the template library on disk (see library_manifest.py),
+        or None if the library can not be found from cds.lib.
+        '''
+        libpath=find_library(self.template_library_name)
+        if libpath is None:
+            return None
+        return stable_hash(library_state(libpath))
+
+    def reload_schematic(self):
+        '''
+        Reload the schematic generator of this package and the corresponding module 
+        in BagModules, if they have been imported, so that remapped schematic generators
+        are in effect without restarting the process.
+        '''
+        importlib.invalidate_caches()
+        suffix='%s.%s' % (self.template_library_name, self.name)
+        names=[ '%s.schematic' % (self.package) ]
+        names+=[ name for name in list(sys.modules) if name==suffix or name.endswith('.'+suffix) ]
+        for name in names:
+            module=sys.modules.get(name)
+            if module is not None:
+                self.print_log(msg='Reloading %s' % (name))
+                importlib.reload(module)
+
     def import_design(self):
         ''' 
         Method to import Virtuoso templates to BAG environment
@@ -420,6 +829,12 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
         BagModules to <design>.schematic submodule. Making your module definition \
         independent of BAG installation location. 
 
+        The mapped modules are reloaded in this process (see reload_schematic).
+
+        The import is skipped if the schematic generator exists and the template
+        library found from cds.lib has not changed since the previous import
+        (see template_library_state).
+
         '''
         #Parameters
         bag_project=self.bag_project
@@ -427,9 +842,6 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
 
         cell=self.name
 
-        # Import the templates
-        self.print_log(msg='Importing netlist from virtuoso\n')
-        
         # Path definitions 
         bag_home=self.BAGHOME
         thispath=os.path.dirname(os.path.realpath(self._classfile))
@@ -443,8 +855,28 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
         else:
             newpackage = True
 
+        # Skip the import if nothing has changed
+        state=self.template_library_state()
+        manifest=self.import_manifest_file()
+        if not newpackage and state is not None:
+            try:
+                with open(manifest, 'r') as f:
+                    previous=json.load(f).get('state')
+            except (OSError, ValueError):
+                previous=None
+            if previous==state:
+                self.print_log(msg='Template library %s unchanged, skipping netlist import' % (template_library))
+                return
+
+        # Import the templates
+        self.print_log(msg='Importing netlist from virtuoso\n')
+
         #Importing template library
         bag_project.import_design_library(template_library)
+        if newpackage and not os.path.isfile(packagename):
+            # E.g. offline backend, which can not import from Virtuoso
+            self.print_log(type='F', msg='Import of %s did not create %s. With the %s backend, import it online first.' 
+                    % (template_library, packagename, self.backend))
 
         # Schematic generator should be a submodule in THIS directory
         if not newpackage:
@@ -457,89 +889,733 @@ class bag_design(BAG_technology_definition, bag_startup,metaclass=abc.ABCMeta):
             with open(schematic_generator, 'r') as generator_file:
                 if not 'class schematic(Module):' in generator_file.read():
                     self.print_log(msg='Existing generator does not contain schematic class')
-                    self.print_log(msg='Not compatible with this generator structure.\n Exiting')
-                    quit()
+                    self.print_log(type='F', msg='Not compatible with this generator structure.')
                 else:
                     self.print_log(msg='Mapping %s to generated class.' %(schematic_generator))
                     #Here, figure out what to do with the generated module AND _new_ generator
-                    inputfile=open(packagename, 'r').readlines()
-                    tempfile=open(tempgenfile, 'w')
-                    done = False
-                       
-                    for line in inputfile:
-                        if re.match('from bag.design.module import Module',line):
-                            tempfile.write('from %s.schematic import schematic as %s__%s\n' %(self.package,template_library,cell))
-                        else:
-                            pass
-                            #tempfile.write(line) 
-                    tempfile.close()
+                    with open(packagename, 'r') as f:
+                        inputfile=f.readlines()
+                    with open(tempgenfile, 'w') as tempfile:
+                        for line in inputfile:
+                            if re.match('from bag.design.module import Module',line):
+                                tempfile.write('from %s.schematic import schematic as %s__%s\n' %(self.package,template_library,cell))
                     os.rename(tempgenfile, packagename)
-                    self.print_log(msg='We need to re-run this to have mapped generators in effect') 
-                    quit()
+                    self.reload_schematic()
 
         else:
             # Transfer schematic generator to thispath/schematic.py
             # One cell per directory. Import others from other generators
-            os.path.dirname(os.path.realpath(self._classfile)) + "/"+__name__
             self.print_log(msg='Copying schematic generator to %s ' %(thispath+'/schematic.py'))
             copy2(packagename, schematic_generator)
       
             # First we generate a template to be transferred to
             # new_lib_path (BAGHOME/BagModules/template_library/cell.py
-            inputfile=open(schematic_generator, 'r').readlines()
-            tempfile=open(tempgenfile, 'w')
-            done = False
-
-            for line in inputfile:
-                if re.match('from bag.design.module import Module',line):
-                    tempfile.write('from %s.schematic import schematic as %s__%s\n' 
-                            %(cell,template_library,cell))
-                else:
-                    pass
-            tempfile.close()
+            with open(schematic_generator, 'r') as f:
+                inputfile=f.readlines()
+            with open(tempgenfile, 'w') as tempfile:
+                for line in inputfile:
+                    if re.match('from bag.design.module import Module',line):
+                        tempfile.write('from %s.schematic import schematic as %s__%s\n' 
+                                %(self.package,template_library,cell))
             #Move this to BagModules 
             os.rename(tempgenfile, packagename)
 
-            tempfile=open(tempgenfile, 'w')
             #Then rename the actual generator to class schematic        
-            for line in inputfile:
-                if re.match('class '+ template_library+ '__' + cell+'\(Module\):',line ):
-                    tempfile.write('class schematic(Module):\n')
-                else:
-                   tempfile.write(line)
-            tempfile.close()
+            with open(tempgenfile, 'w') as tempfile:
+                for line in inputfile:
+                    if re.match('class '+ template_library+ '__' + cell+r'\(Module\):',line ):
+                        tempfile.write('class schematic(Module):\n')
+                    else:
+                       tempfile.write(line)
             os.rename(tempgenfile, schematic_generator)
-            os.rename(tempgenfile, packagename)
-            self.print_log(msg='You need to re-run this to have mapped generators in effect') 
-            quit()
-        #
+            self.reload_schematic()
+
+        if state is not None:
+            try:
+                os.makedirs(os.path.dirname(manifest), exist_ok=True)
+                with open(manifest, 'w') as f:
+                    json.dump({ 'library' : template_library, 'state' : state, 'time' : time.time() }, f, indent=4)
+            except OSError as e:
+                self.print_log(type='W', msg='Could not write import manifest %s: %s' % (manifest, e))
         self.print_log(msg='Netlist import done')
 
-    def generate(self):
-        self.import_design()
-        dsn = self.bag_project.create_design_module(self.template_library_name, self.name)
+    @property
+    def trace(self):
+        '''
+        Time the phases of generate and generate_many. See profiling.py.
+        Default : True if environment variable BAG_ECD_TRACE is set
+        '''
+        if not hasattr(self, '_trace'):
+            self._trace=bool(os.environ.get('BAG_ECD_TRACE'))
+        return self._trace
+    @trace.setter
+    def trace(self, val):
+        self._trace=val
+
+    @property
+    def trace_file(self):
+        '''
+        File to write the Chrome trace event JSON of the timed phases to.
+        Default : BAG_ECD_TRACE if it is a file name, otherwise <logfile>.trace.json
+        '''
+        if not hasattr(self, '_trace_file'):
+            env=os.environ.get('BAG_ECD_TRACE', '')
+            self._trace_file=env if env not in ('', '1') else bag_design.logfile+'.trace.json'
+        return self._trace_file
+    @trace_file.setter
+    def trace_file(self, val):
+        self._trace_file=val
+
+    @property
+    def memtrace(self):
+        '''
+        Record also the memory use of the traced phases. See profiling.py.
+        Implies trace. Slows down generation considerably.
+        Default : True if environment variable BAG_ECD_MEMTRACE is set
+        '''
+        if not hasattr(self, '_memtrace'):
+            self._memtrace=bool(os.environ.get('BAG_ECD_MEMTRACE'))
+        return self._memtrace
+    @memtrace.setter
+    def memtrace(self, val):
+        self._memtrace=val
+
+    def phase(self, name, **args):
+        '''
+        Context manager timing a phase of generation if trace or memtrace is True.
+        '''
+        if not (self.trace or self.memtrace):
+            return null_phase
+        return phase_tracer.tracer.phase(name, memory=self.memtrace, generator=self.__class__.__name__, **args)
+
+    def trace_report(self):
+        '''
+        Write the trace file and log the summary of the timed phases, if trace or memtrace is True
+        and no phase is running anymore (e.g. at the end of the top-level generate).
+        The recorded phases are then cleared, so that each report covers one generation.
+        '''
+        tracer=phase_tracer.tracer
+        if not (self.trace or self.memtrace) or tracer.depth > 0:
+            return
+        try:
+            tracer.write_chrome_trace(self.trace_file)
+            self.print_log(msg='Wrote phase trace to %s' % (self.trace_file))
+        except OSError as e:
+            self.print_log(type='W', msg='Could not write phase trace %s: %s' % (self.trace_file, e))
+        self.print_log(msg='Generation phases:\n%s' % (tracer.summary()))
+        if self.memtrace:
+            self.print_log(msg='Memory use of generation phases:\n%s' % (tracer.memory_summary()))
+        tracer.clear()
+
+    @property
+    def manifest_dir(self):
+        '''
+        Directory of the generation manifests, which record the fingerprint of the
+        last generated version of each cell.
+        Default : BAGHOME/.bag_ecd_manifests
+        '''
+        if not hasattr(self, '_manifest_dir'):
+            self._manifest_dir=os.path.join(self.BAGHOME, '.bag_ecd_manifests')
+        return self._manifest_dir
+    @manifest_dir.setter
+    def manifest_dir(self, val):
+        self._manifest_dir=val
+
+    def manifest_file(self, cell_name=None):
+        '''
+        Generation manifest of cell_name (default: self.name) in the implementation library.
+        '''
+        if cell_name is None:
+            cell_name=self.name
+        return os.path.join(self.manifest_dir, self.implementation_library_name, cell_name+'.json')
+
+    def generation_sources(self):
+        '''
+        Files that affect the generated design: Python sources of this generator
+        package and of the layout generator, technology definition, and technology
+        configuration files in BAG_TECH_CONFIG_DIR.
+        '''
+        sources=source_files(os.path.dirname(os.path.realpath(self._classfile)))
+        for cls in [ self.layout, BAG_technology_definition ]:
+            module=sys.modules.get(cls.__module__)
+            if getattr(module, '__file__', None):
+                sources.append(os.path.realpath(module.__file__))
+        techdir=os.environ.get('BAG_TECH_CONFIG_DIR', '')
+        if os.path.isdir(techdir):
+            sources.extend(os.path.join(techdir, f) for f in os.listdir(techdir) 
+                    if f.endswith(('.yaml', '.py')))
+        return sources
+
+    def generation_fingerprint(self, cell_name=None, sch_params=None):
+        '''
+        Hash of everything the generated cell depends on: layout parameters, schematic
+        parameters set by the user (default: input_sch_params), grid options, BAG 
+        configuration, backend, library names and the files given by generation_sources.
+        '''
+        if sch_params is None:
+            sch_params=self.input_sch_params()
+        return stable_hash({
+            'cell' : cell_name if cell_name is not None else self.name,
+            'template_library' : self.template_library_name,
+            'implementation_library' : self.implementation_library_name,
+            'layout' : self.layout,
+            'layout_params' : self.layout_params,
+            'sch_params' : sch_params,
+            'grid_opts' : self.grid_opts,
+            'bag_config' : self.bag_config,
+            'backend' : self.backend,
+            'sources' : file_digest(self.generation_sources()),
+            })
+
+    def dependency_fingerprint(self, cell_name=None, masters=None, memo=None, sch_params=None):
+        '''
+        Hash of the cell and everything below it in the hierarchy: generation_fingerprint
+        of this generator, dependency_fingerprint of its children and the contents of 
+        the source files of the layout masters (see layout_master_sources). A change
+        anywhere in a subtree changes the fingerprints of all generators above it.
+
+        Parameters:
+        -------
+        cell_name : Union[str, None]
+            Cell name. Default: self.name
+        masters : Union[List[str], None]
+            Source files of the layout masters. Default: those recorded in the manifest
+        memo : Union[Dict[int, str], None]
+            Fingerprints of already visited generators by id, shared within one pass
+            over the hierarchy.
+        sch_params : Union[Dict[str, Any], None]
+            Schematic parameters set by the user, see generation_fingerprint.
+        '''
+        if memo is None:
+            memo={}
+        if masters is None:
+            masters=self.read_manifest(cell_name).get('masters', [])
+        children=[]
+        for child in self.children:
+            if id(child) not in memo:
+                memo[id(child)]=child.dependency_fingerprint(memo=memo)
+            children.append(memo[id(child)])
+        return stable_hash({ 'generator' : self.generation_fingerprint(cell_name, sch_params), 
+            'children' : children, 'masters' : file_digest(masters) })
+
+    def layout_master_sources(self, template):
+        '''
+        Source files of the classes of template and of all masters instantiated in it, 
+        at any depth. Each master is visited once.
+        '''
+        files=set()
+        seen=set()
+        stack=[ template ]
+        while stack:
+            master=stack.pop()
+            if id(master) in seen:
+                continue
+            seen.add(id(master))
+            module=sys.modules.get(type(master).__module__)
+            if getattr(module, '__file__', None):
+                files.add(os.path.realpath(module.__file__))
+            instance_iter=getattr(master, 'instance_iter', None)
+            if instance_iter is not None:
+                stack.extend(inst.master for inst in instance_iter())
+        return sorted(files)
+
+    def read_manifest(self, cell_name=None):
+        '''
+        Read the generation manifest of cell_name. Returns an empty dict if there is none.
+        '''
+        try:
+            with open(self.manifest_file(cell_name), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_manifest(self, fingerprint, cell_name=None, masters=None, sch_params=None):
+        '''
+        Record fingerprint as the last generated version of cell_name, the source
+        files of its layout masters and the schematic parameters set by its layout.
+        '''
+        fname=self.manifest_file(cell_name)
+        try:
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            with open(fname, 'w') as f:
+                json.dump({ 'fingerprint' : fingerprint, 'time' : time.time(),
+                    'library' : self.implementation_library_name,
+                    'cell' : cell_name if cell_name is not None else self.name,
+                    'masters' : masters or [], 'sch_params' : sch_params or {} }, 
+                    f, indent=4, default=repr)
+        except OSError as e:
+            self.print_log(type='W', msg='Could not write generation manifest %s: %s' % (fname, e))
+
+    def generate(self, force=False):
+        '''
+        Generate layout and schematic of this design to the implementation library.
+
+        Generation is skipped if the fingerprint (see dependency_fingerprint) equals the
+        one recorded at the previous generation of the cell. Use force=True to
+        generate anyway, e.g. if the implementation library was modified outside BAG.
+        To generate also the sub-generators, see generate_hierarchy.
+        '''
+        self.propagation_report()
+        self.refresh_session()
+        with self.phase('generate'):
+            self._generate(force)
+        self.trace_report()
+
+    def _generate(self, force, memo=None):
+        start=time.perf_counter()
+        input_sch_params=self.input_sch_params()
+        with self.phase('fingerprint'):
+            fingerprint=self.dependency_fingerprint(memo=memo, sch_params=input_sch_params)
+        manifest=self.read_manifest()
+        if not force and manifest.get('fingerprint')==fingerprint:
+            self.print_log(msg='%s in %s is up to date, skipping generation. Use force=True to regenerate.' 
+                    % (self.name, self.implementation_library_name))
+            # Schematic parameters of the layout, as if it was generated
+            self.layout_sch_params=manifest.get('sch_params', {})
+            self.sch_params.update(self.layout_sch_params)
+            if memo is not None:
+                memo[id(self)]=fingerprint
+            return False
+        with self.phase('import_design'):
+            self.import_design()
+        with self.phase('create_design_module'):
+            dsn = self.bag_project.create_design_module(self.template_library_name, self.name)
         self.print_log(msg='Creating template library and cell')
         
         #This is an instance of template database from bag templates
         #Parameters to TemplateDb
-        tdb = TemplateDB('template_libs.def', self.routing_grid, self.implementation_library_name, use_cybagoa=True)
+        tdb = TemplateDB('template_libs.def', self.routing_grid, self.implementation_library_name, use_cybagoa=self.use_cybagoa)
         #This is a instance of a template created with template database
         self.print_log(msg='Generating layout ...')
-        layout_template= tdb.new_template(params=self.layout_params, temp_cls=self.layout, debug=True)
-        tdb.instantiate_layout(self.bag_project, layout_template, self.name, debug=True)
+        timings={}
+        with self.phase('new_template'):
+            t=time.perf_counter()
+            layout_template= tdb.new_template(params=self.layout_params, temp_cls=self.layout, debug=True)
+            timings['new_template']=time.perf_counter()-t
+        with self.phase('instantiate_layout'):
+            t=time.perf_counter()
+            tdb.instantiate_layout(self.bag_project, layout_template, self.name, debug=True)
+            timings['instantiate_layout']=time.perf_counter()-t
+        layout_sch_params={}
         if hasattr(layout_template, 'sch_dummy_info'):
             self.print_log(msg='sch_dummy_info should be included in sch_params! Including it now!')
-            self.sch_params.update({'sch_dummy_info' : layout_template.sch_dummy_info})
+            layout_sch_params.update({'sch_dummy_info' : layout_template.sch_dummy_info})
         
         #Update the schematic parameters from the layout
-        self.sch_params.update(layout_template.sch_params)
+        layout_sch_params.update(layout_template.sch_params)
+        self.sch_params.update(layout_sch_params)
+        self.layout_sch_params=layout_sch_params
 
         self.print_log(msg='Finished implementing layout')
 
         ##This implements schematic
         self.print_log(msg='Generating schematic ...')
-        dsn.design(**self.sch_params)
-        dsn.implement_design(self.implementation_library_name, top_cell_name=self.name)
+        t=time.perf_counter()
+        with self.phase('design'):
+            dsn.design(**self.sch_params)
+        with self.phase('implement_design'):
+            dsn.implement_design(self.implementation_library_name, top_cell_name=self.name)
+        timings['implement_schematic']=time.perf_counter()-t
         self.print_log(msg='Finished implementing schematic')
+        masters=self.layout_master_sources(layout_template)
+        fingerprint=self.dependency_fingerprint(masters=masters, memo=memo, sch_params=input_sch_params)
+        if memo is not None:
+            memo[id(self)]=fingerprint
+        self.write_manifest(fingerprint, masters=masters, sch_params=layout_sch_params)
+        timings['total']=time.perf_counter()-start
+        self.store_params({ 'cell' : self.name, 'layout_params' : self.layout_params, 
+            'sch_params' : self.sch_params, 'timings' : timings })
+        return True
+
+    def generate_hierarchy(self, force=False):
+        '''
+        Generate this design and all sub-generators below it (see children), children
+        first. Top-level parameters changed since they were last propagated are
+        propagated through the hierarchy before generation. Parameters set in the 
+        sub-generators are kept otherwise, see propagate.
+        
+        Generators whose subtree is up to date are skipped (see dependency_fingerprint), 
+        and their cells in the implementation libraries are reused. If a parameter of 
+        a leaf generator changes, only the leaf and the generators above it are 
+        regenerated.
+
+        Parameters:
+        -------
+        force : boolean
+            Generate all generators of the hierarchy.
+
+        Returns:
+        -------
+        results : List[Dict[str, Any]]
+            For each generator in the order of generation: 'generator' (class name), 
+            'library', 'cell' and 'generated' (False if it was up to date).
+        '''
+        self.propagation.propagate(changed=True)
+        self.propagation_report()
+        results=[]
+        memo={}
+        with self.phase('generate_hierarchy'):
+            for node in self.dependency_graph():
+                node.refresh_session()
+                with node.phase('generate'):
+                    generated=node._generate(force, memo)
+                results.append({ 'generator' : node.__class__.__name__, 'cell' : node.name,
+                    'library' : node.implementation_library_name, 'generated' : generated })
+        self.print_log(msg='Generated %d of %d generators of the hierarchy' 
+                % (sum(result['generated'] for result in results), len(results)))
+        self.trace_report()
+        return results
+
+    def variant_name(self, naming, index, params):
+        '''
+        Cell name of a variant generated with generate_many.
+
+        Parameters:
+        -------
+        naming : Union[str, Callable[[int, Dict[str, Any]], str], None]
+            Format string with fields name, index and the layout parameter names
+            with the values of the variant, e.g. '{name}_w{w}', or function of index and parameters returning
+            the name. Default: '{name}_{index}'
+        index : int
+            Index of the variant
+        params : Dict[str, Any]
+            Parameters of the variant
+
+        Returns:
+        -------
+        cell_name : str
+        '''
+        if naming is None:
+            naming='{name}_{index}'
+        if callable(naming):
+            return naming(index, params)
+        return naming.format(**{ **self.layout_params, **params, 'name' : self.name, 'index' : index })
+
+    def generate_many(self, param_sets, naming=None, force=False):
+        '''
+        Generate a variant of this design for each set of parameters.
+
+        All variants share the BagProject, routing grid and template database
+        (see template_db) of this generator, so templates with equal parameters
+        are created only once. The design library is imported once and the
+        layouts and the schematics of all variants are each instantiated in one 
+        transaction.
+        Variants that are up to date are skipped as in generate.
+
+        If pipeline is greater than zero, the variants are instead implemented 
+        (layout and schematic) in a worker thread as soon as their templates are ready,
+        while the templates of the following variants are computed. The worker 
+        implements the variants waiting for it in one transaction, and at most 
+        pipeline variants wait. Variants are implemented in order.
+        With use_cybagoa, the template database writes the layouts while holding 
+        template_db_lock, so no templates are computed meanwhile and the pipeline 
+        only overlaps the schematic stage.
+
+        Parameters:
+        -------
+        param_sets : Iterable[Dict[str, Any]]
+            Generator attributes to set for each variant, e.g. [{'w' : 4}, {'w' : 8}]
+            Attributes are restored after the variants are created.
+        naming : Union[str, Callable[[int, Dict[str, Any]], str], None]
+            Cell names of the variants, see variant_name.
+        force : boolean
+            Generate also the variants that are up to date.
+
+        Returns:
+        -------
+        results : List[Dict[str, Any]]
+            For each variant in the order of param_sets: 'cell', 'library', 'layout_params',
+            'sch_params', 'timings' (seconds per stage) and 'skipped' (True if the variant 
+            was up to date). Generated variants are also appended to param_store.
+        '''
+        self.propagation_report()
+        self.refresh_session()
+        with self.phase('generate_many'):
+            results=self._generate_many(param_sets, naming, force)
+        self.trace_report()
+        return results
+
+    def _implement_variants(self, jobs):
+        '''
+        Instantiate layouts and schematics of the variants prepared by _generate_many,
+        the stage of the generate_many pipeline.
+        '''
+        results=[ result for template, result, manifest in jobs ]
+        t=time.perf_counter()
+        with self.phase('instantiate_layout', variants=len(jobs)):
+            self._instantiate_layouts([ template for template, result, manifest in jobs ],
+                    [ result['cell'] for result in results ])
+        batch_time=time.perf_counter()-t
+        for result in results:
+            result['timings']['instantiate_layout_batch']=batch_time
+        self._implement_schematics(results, [ manifest for template, result, manifest in jobs ])
+        return results
+
+    def _instantiate_layouts(self, templates, cells):
+        '''
+        Instantiate the layouts of templates of template_db as cells, in one transaction.
+
+        The layout content is built while holding template_db_lock, but written to 
+        bag_project after releasing it, so that the next templates of the 
+        generate_many pipeline are computed meanwhile. With use_cybagoa, the
+        template database writes the layouts itself, under the lock.
+        The layouts are written while holding implementation_lock.
+        '''
+        if self.use_cybagoa:
+            with self.implementation_lock, self.template_db_lock:
+                self._batch_layout(self.bag_project, templates, cells)
+            return
+        project=_layout_recorder(self.bag_project)
+        with self.template_db_lock:
+            self._batch_layout(project, templates, cells)
+        with self.implementation_lock:
+            for args, kwargs in project.calls:
+                self.bag_project.instantiate_layout(*args, **kwargs)
+
+    def _batch_layout(self, project, templates, cells):
+        tdb=self.template_db
+        if hasattr(tdb, 'batch_layout'):
+            tdb.batch_layout(project, templates, cells, debug=True)
+        else:
+            for template, cell in zip(templates, cells):
+                tdb.instantiate_layout(project, template, cell, debug=True)
+
+    def _implement_schematic(self, result, manifest):
+        self._implement_schematics([ result ], [ manifest ])
+
+    def _implement_schematics(self, results, manifests):
+        '''
+        Design the schematics of the variants in results, and implement them with
+        one instantiate_masters call of the schematic database (MasterDB) of the 
+        design modules, so that the schematics are written in one transaction. 
+        Design modules without a database are implemented one by one.
+        '''
+        designs=[]
+        for result in results:
+            t=time.perf_counter()
+            with self.phase('create_design_module', cell=result['cell']):
+                dsn = self.bag_project.create_design_module(self.template_library_name, self.name)
+            with self.phase('design', cell=result['cell']):
+                dsn.design(**result['sch_params'])
+            result['timings']['design']=time.perf_counter()-t
+            designs.append(dsn)
+        t=time.perf_counter()
+        with self.phase('implement_design', variants=len(designs)), self.implementation_lock:
+            databases={}
+            for dsn, result in zip(designs, results):
+                db=getattr(dsn, 'master_db', None)
+                if hasattr(db, 'instantiate_masters'):
+                    databases.setdefault(id(db), (db, []))[1].append((dsn, result['cell']))
+                else:
+                    dsn.implement_design(self.implementation_library_name, top_cell_name=result['cell'])
+            for db, masters in databases.values():
+                db.instantiate_masters([ dsn for dsn, cell in masters ], [ cell for dsn, cell in masters ],
+                        lib_name=self.implementation_library_name)
+        batch_time=time.perf_counter()-t
+        for result, manifest in zip(results, manifests):
+            result['timings']['implement_schematic_batch']=batch_time
+            self.write_manifest(cell_name=result['cell'], **manifest)
+            self.store_params(result)
+
+    def _generate_many(self, param_sets, naming, force):
+        param_sets=[ dict(params) for params in param_sets ]
+        results=[]
+        for index, params in enumerate(param_sets):
+            results.append({ 'cell' : self.variant_name(naming, index, params), 
+                'library' : self.implementation_library_name, 'skipped' : False })
+        cells=[ result['cell'] for result in results ]
+        if len(set(cells)) != len(cells):
+            self.print_log(type='F', msg='Variant names %s are not unique!' % (cells))
+
+        keys={ key for params in param_sets for key in params }
+        saved={ key : getattr(self, key) for key in keys if hasattr(self, key) }
+        base_sch_params=dict(self.sch_params)
+        input_sch_params=self.input_sch_params()
+        templates=[]
+        manifests=[]
+        memo={}
+        imported=False
+        pipeline=None
+        try:
+            for params, result in zip(param_sets, results):
+                for key, value in params.items():
+                    setattr(self, key, value)
+                with self.phase('fingerprint'):
+                    fingerprint=self.dependency_fingerprint(result['cell'], memo=memo, sch_params=input_sch_params)
+                result['layout_params']=dict(self.layout_params)
+                manifest=self.read_manifest(result['cell'])
+                if not force and manifest.get('fingerprint')==fingerprint:
+                    self.print_log(msg='%s in %s is up to date, skipping generation.' 
+                            % (result['cell'], self.implementation_library_name))
+                    result['sch_params']={ **base_sch_params, **manifest.get('sch_params', {}) }
+                    result['skipped']=True
+                    continue
+                if not imported:
+                    with self.phase('import_design'):
+                        self.import_design()
+                    imported=True
+                self.print_log(msg='Generating layout of %s ...' % (result['cell']))
+                result['timings']={}
+                with self.phase('new_template', cell=result['cell']):
+                    t=time.perf_counter()
+                    with self.template_db_lock:
+                        template=self.template_db.new_template(params=result['layout_params'], temp_cls=self.layout, debug=True)
+                    result['timings']['new_template']=time.perf_counter()-t
+                layout_sch_params={}
+                if hasattr(template, 'sch_dummy_info'):
+                    layout_sch_params.update({'sch_dummy_info' : template.sch_dummy_info})
+                layout_sch_params.update(template.sch_params)
+                result['sch_params']={ **base_sch_params, **layout_sch_params }
+                masters=self.layout_master_sources(template)
+                fingerprint=self.dependency_fingerprint(result['cell'], masters=masters, memo=memo, 
+                        sch_params=input_sch_params)
+                manifest={ 'fingerprint' : fingerprint, 'masters' : masters, 'sch_params' : layout_sch_params }
+                if self.pipeline > 0:
+                    if pipeline is None:
+                        self.print_log(msg='Implementing variants in a pipeline of depth %d' % (self.pipeline))
+                        if self.use_cybagoa:
+                            self.print_log(type='W', msg='Layouts are written with cybagoa under template_db_lock, '
+                                    'the pipeline only overlaps the schematic stage. Set use_cybagoa=False '
+                                    'to overlap also the layout stage.')
+                        pipeline=ordered_pipeline(self._implement_variants, depth=self.pipeline, batch=True)
+                    pipeline.put((template, result, manifest))
+                    continue
+                templates.append((template, result))
+                manifests.append(manifest)
+        finally:
+            for key, value in saved.items():
+                setattr(self, key, value)
+            if pipeline is not None:
+                pipeline.close(check=False)
+        if pipeline is not None:
+            pipeline.check()
+            self.print_log(msg='Finished implementing %d variants' % (len(pipeline.results)))
+
+        if not templates:
+            return results
+        self.print_log(msg='Instantiating %d layouts' % (len(templates)))
+        t=time.perf_counter()
+        with self.phase('instantiate_layout', variants=len(templates)):
+            self._instantiate_layouts([ template for template, result in templates ], 
+                    [ result['cell'] for template, result in templates ])
+        batch_time=time.perf_counter()-t
+        for template, result in templates:
+            result['timings']['instantiate_layout_batch']=batch_time
+        self.print_log(msg='Finished implementing layouts')
+
+        self.print_log(msg='Generating %d schematics ...' % (len(templates)))
+        self._implement_schematics([ result for template, result in templates ], manifests)
+        self.print_log(msg='Finished implementing schematics')
+        return results
+
+    def generate_parallel(self, param_sets, naming=None, processes=None, force=False):
+        '''
+        Generate variants of this design in parallel processes. 
+
+        The variants are split to one chunk per process, and each chunk is generated
+        with generate_many in a forked process. All chunks are generated to 
+        implementation_library_name, and the processes write to it one at a time
+        (see implementation_lock), so the result does not depend on the number of 
+        processes. Each chunk has its own logfile, <logfile>_p<chunk>. The chunk logs
+        are appended to the logfile of this process and removed when all chunks are done.
+
+        Parameters:
+        -------
+        param_sets : Iterable[Dict[str, Any]]
+            Generator attributes to set for each variant, see generate_many.
+        naming : Union[str, Callable[[int, Dict[str, Any]], str], None]
+            Cell names of the variants, see variant_name.
+        processes : Union[int, None]
+            Number of processes. Default: number of CPUs, at most the number of variants.
+        force : boolean
+            Generate also the variants that are up to date.
+
+        Returns:
+        -------
+        results : List[Dict[str, Any]]
+            Results of generate_many in the order of param_sets.
+        '''
+        global _parallel_job
+        param_sets=[ dict(params) for params in param_sets ]
+        if not param_sets:
+            return []
+        if processes is None:
+            processes=os.cpu_count() or 1
+        processes=max(1, min(processes, len(param_sets)))
+        cells=[ self.variant_name(naming, index, params) for index, params in enumerate(param_sets) ]
+        if len(set(cells)) != len(cells):
+            self.print_log(type='F', msg='Variant names %s are not unique!' % (cells))
+        # Contiguous chunks, so that neighbouring variants share templates
+        bounds=[ len(param_sets)*k//processes for k in range(processes+1) ]
+        chunks=[ list(range(bounds[k], bounds[k+1])) for k in range(processes) ]
+        self.print_log(msg='Generating %d variants in %d processes' % (len(param_sets), processes))
+        context=multiprocessing.get_context('fork')
+        _parallel_job={ 'generator' : self, 'param_sets' : param_sets, 'cells' : cells, 
+                'chunks' : chunks, 'force' : force, 'logfile' : bag_design.logfile, 
+                'lock' : context.Lock() }
+        try:
+            with context.Pool(processes, initializer=_parallel_init) as pool:
+                chunk_results=pool.map(_parallel_chunk, range(processes), chunksize=1)
+        finally:
+            _parallel_job=None
+
+        # Merge results and logs in deterministic order
+        results=[ None ] * len(param_sets)
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            for index, result in zip(chunk, chunk_result):
+                results[index]=result
+        logfile=bag_design.logfile
+        for k in range(processes):
+            chunklog='%s_p%d' % (logfile, k)
+            if os.path.isfile(chunklog):
+                with open(chunklog, 'r') as f:
+                    log_sink.sink.write(logfile, f.read())
+                os.remove(chunklog)
+        self.print_log(msg='Finished generating %d variants' % (len(param_sets)))
+        return results
+
+class _layout_recorder():
+    '''
+    Project passed to TemplateDB.batch_layout to record the layout content instead
+    of writing it, see bag_design._instantiate_layouts. Other attributes are those 
+    of project.
+    '''
+    def __init__(self, project):
+        self._project=project
+        self.calls=[]
+
+    def instantiate_layout(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._project, name)
+
+#State of the generate_parallel call, inherited by the forked worker processes
+_parallel_job=None
 
+def _parallel_init():
+    '''
+    Initializer of generate_parallel worker processes. The BAG project,
+    routing grid and template database of the parent are not shared.
+    '''
+    generator=_parallel_job['generator']
+    for attr in [ '_bag_project', '_bag_project_pool', '_routing_grid', '_template_db', '_template_db_lock', 
+            '_implementation_lock' ]:
+        generator.__dict__.pop(attr, None)
 
+def _parallel_chunk(chunk):
+    '''
+    Generate chunk of the variants of generate_parallel in a worker process.
+    '''
+    job=_parallel_job
+    generator=job['generator']
+    log_sink.sink.close()
+    bag_design.logfile='%s_p%d' % (job['logfile'], chunk)
+    generator.implementation_lock=job['lock']
+    generator.__dict__.pop('_template_db', None)
+    indices=job['chunks'][chunk]
+    cells=[ job['cells'][index] for index in indices ]
+    results=generator.generate_many([ job['param_sets'][index] for index in indices ], 
+            naming=lambda index, params: cells[index], force=job['force'])
+    log_sink.sink.close()
+    return results
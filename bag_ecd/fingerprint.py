@@ -0,0 +1,67 @@
+'''
+BAG ECD --- fingerprint.py
+
+Stable hashing of generator parameters and source files.
+
+The hashes do not depend on dictionary ordering, process or Python hash
+seed, so they can be stored and compared across runs.
+
+'''
+import os
+import json
+import hashlib
+
+def canonical(obj):
+    '''
+    Convert obj to a JSON serializable structure that is equal for equal values.
+    Dictionaries are sorted by key, tuples and sets become lists, classes and
+    functions are represented by their qualified names and other
+    unknown objects by their repr.
+    '''
+    if obj is None or isinstance(obj, (bool, int, str)):
+        return obj
+    if isinstance(obj, float):
+        return repr(obj)
+    if isinstance(obj, dict):
+        return [ [ canonical(key), canonical(obj[key]) ] for key in sorted(obj, key=repr) ]
+    if isinstance(obj, (list, tuple)):
+        return [ canonical(item) for item in obj ]
+    if isinstance(obj, (set, frozenset)):
+        return sorted((canonical(item) for item in obj), key=repr)
+    if isinstance(obj, type) or callable(obj) and hasattr(obj, '__qualname__'):
+        return '%s.%s' % (getattr(obj, '__module__', ''), obj.__qualname__)
+    if hasattr(obj, 'tolist'): # numpy arrays and scalars
+        return canonical(obj.tolist())
+    return repr(obj)
+
+def stable_hash(obj):
+    '''
+    SHA-256 hex digest of the canonical representation of obj.
+    '''
+    data = json.dumps(canonical(obj), separators=(',', ':'))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+def file_digest(paths):
+    '''
+    SHA-256 hex digest of the names and contents of the given files.
+    Missing files are included as missing, so their appearance changes the digest.
+    '''
+    digest = hashlib.sha256()
+    for path in sorted(set(paths)):
+        digest.update(path.encode() + b'\0')
+        try:
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        except OSError:
+            digest.update(b'missing')
+    return digest.hexdigest()
+
+def source_files(dirpath, extensions=('.py',)):
+    '''
+    List the files with the given extensions under dirpath, excluding __pycache__.
+    '''
+    files = []
+    for root, dirnames, filenames in os.walk(dirpath):
+        dirnames[:] = [ d for d in dirnames if d != '__pycache__' and not d.startswith('.') ]
+        files.extend(os.path.join(root, f) for f in filenames if f.endswith(extensions))
+    return files
@@ -0,0 +1,104 @@
+'''
+BAG ECD --- generator_finder.py
+
+Import hook for the generator packages found in BAGHOME.
+
+Instead of appending the directory of every generator package to sys.path,
+which makes every subsequent import of the process probe those directories,
+the generator packages are registered to a single sys.meta_path finder that
+resolves the package name to its location with one dictionary lookup.
+A generator package never shadows a module or package of the standard
+library or of site-packages: names that the sys.path finder resolves to a
+regular module are not registered. The check is done once per package
+when it is registered, so an import of a generator costs one dictionary
+lookup. Directories on sys.path that merely share the name of a generator,
+e.g. BAGHOME/inverter_gen when running in BAGHOME, would be imported as
+namespace packages, and are thus not left to the sys.path finder.
+Submodules of the generator packages are found through the __path__ of the
+package, as usual.
+
+'''
+import os
+import sys
+import importlib.util
+import importlib.machinery
+
+class generator_finder():
+    '''
+    Meta path finder mapping generator package names to their locations.
+
+    A package is registered with the directory containing it, e.g.
+    BAGHOME/inverter_gen for the package BAGHOME/inverter_gen/inverter_gen.
+
+    Implements the importlib.abc.MetaPathFinder protocol. The abstract base
+    class is not inherited, as importing it is slow.
+
+    '''
+    def __init__(self):
+        self._packages = {}
+        self._shadowed = {}
+
+    @property
+    def packages(self):
+        ''' Dictionary of registered package names and their root directories '''
+        return self._packages
+
+    @property
+    def shadowed(self):
+        ''' Dictionary of package names not registered, and the modules of the same name '''
+        return self._shadowed
+
+    def __contains__(self, name):
+        return name in self._packages
+
+    def add(self, path):
+        '''
+        Register the generator package located in path/<basename of path>, unless
+        the sys.path finder resolves its name to a regular module or package.
+
+        Returns:
+        -------
+        registered : bool
+        '''
+        path = os.path.normpath(path)
+        name = os.path.basename(path)
+        spec = importlib.machinery.PathFinder.find_spec(name)
+        if spec is not None and spec.loader is not None and spec.origin is not None:
+            self._shadowed[name] = spec.origin
+            return False
+        self._packages[name] = path
+        return True
+
+    def invalidate_caches(self):
+        pass
+
+    def find_spec(self, fullname, path=None, target=None):
+        if path is not None: # Submodules are found via __path__ of the package
+            return None
+        root = self._packages.get(fullname)
+        if root is None:
+            return None
+        pkgdir = os.path.join(root, fullname)
+        initfile = os.path.join(pkgdir, '__init__.py')
+        if not os.path.isfile(initfile):
+            return None
+        return importlib.util.spec_from_file_location(fullname, initfile,
+                submodule_search_locations=[pkgdir])
+
+    @classmethod
+    def install(cls):
+        '''
+        Return the finder of this process, inserting it to sys.meta_path before
+        the sys.path finder if it is not there yet.
+        '''
+        for finder in sys.meta_path:
+            if isinstance(finder, cls):
+                return finder
+        finder = cls()
+        position = len(sys.meta_path)
+        for i, other in enumerate(sys.meta_path):
+            if other is importlib.machinery.PathFinder:
+                position = i
+                break
+        sys.meta_path.insert(position, finder)
+        return finder
@@ -0,0 +1,119 @@
+'''
+BAG ECD --- generator_index.py
+
+Persistent discovery index of the generator packages located in BAGHOME.
+
+Generator packages follow the structure BAGHOME/<name>/<name>/__init__.py.
+Instead of listing BAGHOME and probing every directory on every
+import, the result of the previous scan is stored in an index file. The
+directory listing is re-read only if the modification time of BAGHOME has
+changed, and a candidate directory is re-probed only if its __init__.py
+has appeared, disappeared or been modified.
+
+'''
+import os
+import json
+
+class generator_index():
+    '''
+    Discovery index of generator packages.
+
+    Parameters:
+
+    root : str
+        Directory to search the generators from (BAGHOME).
+    indexfile : str
+        Location of the index file. Default: $BAG_ECD_GENERATOR_INDEX
+        if set, otherwise root/.bag_ecd_generators.json
+
+    '''
+    def __init__(self, root, indexfile=None):
+        self._root = root
+        if indexfile is None:
+            indexfile = os.environ.get('BAG_ECD_GENERATOR_INDEX',
+                    os.path.join(root, '.bag_ecd_generators.json'))
+        self._indexfile = indexfile
+
+    @property
+    def root(self):
+        ''' Directory the generators are searched from '''
+        return self._root
+
+    @property
+    def indexfile(self):
+        ''' Location of the persistent index file '''
+        return self._indexfile
+
+    def load(self):
+        '''
+        Read the index file.
+
+        Returns:
+        -------
+        index : dict
+            Content of the index, or an empty index if the file does not exist,
+            is corrupted or was created for a different root.
+        '''
+        try:
+            with open(self.indexfile, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(index, dict) or index.get('root') != self.root:
+            return {}
+        return index
+
+    def save(self, index):
+        '''
+        Write the index file. The file is rewritten in place, as replacing it
+        would change the modification time of root, which is part of the index.
+        A concurrently corrupted file is detected and rebuilt by load.
+        Failures (e.g. read-only work area) are ignored, as the index is only a cache.
+        '''
+        try:
+            with open(self.indexfile, 'w') as f:
+                json.dump(index, f)
+        except OSError:
+            pass
+
+    def scan(self):
+        '''
+        Find the generator packages in root, updating the index incrementally.
+
+        Returns:
+        -------
+        generators : List[str]
+            Paths of the directories containing a generator package, e.g.
+            BAGHOME/inverter_gen for BAGHOME/inverter_gen/inverter_gen/__init__.py
+        '''
+        root = self.root
+        index = self.load()
+        entries = index.get('entries', {})
+        changed = False
+        mtime = os.stat(root).st_mtime_ns
+        if index.get('mtime') != mtime:
+            # Directory content has changed, probe only the new entries
+            listing = {}
+            for item in os.listdir(root):
+                if item in entries:
+                    listing[item] = entries[item]
+                else:
+                    listing[item] = { 'dir' : not os.path.isfile(os.path.join(root, item)), 'init' : None }
+            entries = listing
+            changed = True
+        generators = []
+        for item, entry in entries.items():
+            if not entry['dir']:
+                continue
+            try:
+                init = os.stat(os.path.join(root, item, item, '__init__.py')).st_mtime_ns
+            except OSError:
+                init = None
+            if init != entry['init']:
+                entry['init'] = init
+                changed = True
+            if init is not None:
+                generators.append(os.path.join(root, item))
+        if changed:
+            self.save({ 'root' : root, 'mtime' : mtime, 'entries' : entries })
+        return generators
@@ -0,0 +1,87 @@
+'''
+BAG ECD --- grid_cache.py
+
+Process-wide cache of routing grids.
+
+Generators of a hierarchy usually use the same BAG_technology_definition.grid_opts
+and thus identical routing grids. The grids are cached by technology and
+grid options, so that all generators of a process share one grid object.
+The least recently used grids are evicted when the cache is full.
+
+As with any grid given to a TemplateDB, a shared grid must not be modified.
+Templates that need a modified grid should modify a copy of it.
+
+'''
+import os
+import threading
+from collections import OrderedDict
+from bag_ecd.fingerprint import stable_hash
+
+class grid_cache():
+    '''
+    Size-bounded cache of routing grids. Use the shared instance grid_cache.cache.
+
+    Parameters:
+
+    maxsize : int
+        Maximum number of cached grids. Default: environment variable
+        BAG_ECD_GRID_CACHE_SIZE or 8.
+
+    '''
+    #Grid options affecting the grid
+    OPTIONS = ( 'layers', 'spaces', 'widths', 'bot_dir', 'width_override' )
+
+    def __init__(self, maxsize=None):
+        if maxsize is None:
+            maxsize = int(os.environ.get('BAG_ECD_GRID_CACHE_SIZE', 8))
+        self._maxsize = maxsize
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self):
+        ''' Maximum number of cached grids '''
+        return self._maxsize
+    @maxsize.setter
+    def maxsize(self, val):
+        with self._lock:
+            self._maxsize = val
+            self._evict()
+
+    def __len__(self):
+        return len(self._grids)
+
+    def key(self, tech_info, grid_opts):
+        '''
+        Cache key of the grid: identity of tech_info and hash of the canonicalized grid options.
+        Entries keep a reference to tech_info, so the identity is not reused while cached.
+        '''
+        return (id(tech_info), stable_hash({ opt : grid_opts.get(opt) for opt in self.OPTIONS }))
+
+    def get(self, tech_info, grid_opts, factory):
+        '''
+        Return the cached grid of tech_info and grid_opts, or create it with factory().
+        '''
+        key = self.key(tech_info, grid_opts)
+        with self._lock:
+            entry = self._grids.get(key)
+            if entry is not None:
+                self._grids.move_to_end(key)
+                return entry[1]
+        grid = factory()
+        with self._lock:
+            entry = self._grids.setdefault(key, (tech_info, grid))
+            self._grids.move_to_end(key)
+            self._evict()
+        return entry[1]
+
+    def clear(self):
+        ''' Remove all cached grids '''
+        with self._lock:
+            self._grids.clear()
+
+    def _evict(self):
+        while len(self._grids) > max(self._maxsize, 0):
+            self._grids.popitem(last=False)
+
+grid_cache.cache = grid_cache()
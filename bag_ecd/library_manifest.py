@@ -0,0 +1,99 @@
+'''
+BAG ECD --- library_manifest.py
+
+State of Virtuoso libraries on disk, used to skip importing template
+libraries that have not changed since the previous import.
+
+Libraries are located through the DEFINE statements of cds.lib files.
+The state of a library consists of the modification times and sizes of the
+view files of its cells.
+
+'''
+import os
+import re
+
+def cdslib_files():
+    '''
+    Default cds.lib files to search libraries from: cds.lib in the current
+    working directory and in $BAG_WORK_DIR.
+    '''
+    files = [ os.path.join(os.getcwd(), 'cds.lib') ]
+    if 'BAG_WORK_DIR' in os.environ:
+        files.append(os.path.join(os.environ['BAG_WORK_DIR'], 'cds.lib'))
+    return files
+
+def parse_cdslib(fname, libraries=None, _visited=None):
+    '''
+    Read library definitions from a cds.lib file, following INCLUDE/SOFTINCLUDE statements.
+    Later definitions override earlier ones, and UNDEFINE removes a definition.
+
+    Returns:
+    -------
+    libraries : Dict[str, str]
+        Library names and their directories
+    '''
+    if libraries is None:
+        libraries = {}
+    if _visited is None:
+        _visited = set()
+    fname = os.path.realpath(fname)
+    if fname in _visited:
+        return libraries
+    _visited.add(fname)
+    dirname = os.path.dirname(fname)
+    try:
+        with open(fname, 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return libraries
+    for line in lines:
+        line = line.split('#', 1)[0].split('--', 1)[0].strip()
+        words = line.split()
+        if not words:
+            continue
+        keyword = words[0].upper()
+        if keyword == 'DEFINE' and len(words) >= 3:
+            path = os.path.expandvars(os.path.expanduser(words[2]))
+            libraries[words[1]] = os.path.normpath(os.path.join(dirname, path))
+        elif keyword == 'UNDEFINE' and len(words) >= 2:
+            libraries.pop(words[1], None)
+        elif keyword in ('INCLUDE', 'SOFTINCLUDE') and len(words) >= 2:
+            path = os.path.expandvars(os.path.expanduser(words[1]))
+            parse_cdslib(os.path.join(dirname, path), libraries, _visited)
+    return libraries
+
+def find_library(lib_name, files=None):
+    '''
+    Directory of library lib_name, or None if it is not defined in any of the
+    cds.lib files (default: cdslib_files()) or does not exist.
+    '''
+    for fname in (files if files is not None else cdslib_files()):
+        path = parse_cdslib(fname).get(lib_name)
+        if path is not None and os.path.isdir(path):
+            return path
+    return None
+
+def library_state(libpath):
+    '''
+    State of the library in directory libpath.
+
+    Returns:
+    -------
+    state : Dict[str, Tuple[int, int]]
+        Modification time in nanoseconds and size of every file of the cells,
+        keyed by path relative to libpath.
+    '''
+    state = {}
+    for root, dirnames, filenames in os.walk(libpath):
+        dirnames[:] = [ d for d in dirnames if not d.startswith('.') ]
+        for fname in filenames:
+            # Lock files change on every open of the library
+            if fname.startswith('.') or re.search(r'\.cdslck', fname):
+                continue
+            path = os.path.join(root, fname)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            state[os.path.relpath(path, libpath)] = (st.st_mtime_ns, st.st_size)
+    return state
@@ -0,0 +1,158 @@
+'''
+BAG ECD --- log_sink.py
+
+Buffered, background thread backed writer for log files.
+
+Log lines are put to a queue and written by a single writer thread, which
+keeps the files open and flushes them whenever the queue runs empty. Thus
+a burst of log messages costs one write per file instead of an
+open/write/close per message. flush() blocks until everything queued so far
+is on disk, and is called before quitting on fatal errors and at exit.
+
+'''
+import os
+import sys
+import queue
+import atexit
+import threading
+
+class log_sink():
+    '''
+    Background writer of log files. Use the shared instance log_sink.sink.
+
+    '''
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._files = {}
+        self._registered = set()
+        self._errors = set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='bag_ecd_log_sink', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        files = self._files
+        while True:
+            item = self._queue.get()
+            op, path, data = item
+            try:
+                if op == 'write':
+                    fid = files.get(path)
+                    if fid is None:
+                        fid = files[path] = open(path, 'a')
+                    fid.write(data)
+                elif op == 'close':
+                    for key in ([path] if path is not None else list(files)):
+                        self._close(key)
+                elif op == 'flush':
+                    for key in list(files):
+                        self._flush(key)
+            except OSError as e:
+                self._failed(path, e)
+            finally:
+                if op != 'write':
+                    data.set()
+            if self._queue.empty():
+                for key in list(files):
+                    self._flush(key)
+
+    def _failed(self, path, error):
+        # The log is lost, but the writer thread must survive to serve flush and close.
+        # The file is dropped and reopened by the next write.
+        fid = self._files.pop(path, None)
+        if fid is not None:
+            try:
+                fid.close()
+            except OSError:
+                pass
+        if path not in self._errors:
+            self._errors.add(path)
+            try:
+                sys.stderr.write('Writing log file %s failed: %s\n' % (path, error))
+            except Exception:
+                pass
+
+    def _flush(self, path):
+        try:
+            self._files[path].flush()
+        except OSError as e:
+            self._failed(path, e)
+
+    def _close(self, path):
+        fid = self._files.pop(path, None)
+        if fid is not None:
+            try:
+                fid.close()
+            except OSError as e:
+                self._failed(path, e)
+
+    def register(self, path):
+        '''
+        Mark path as used by this process.
+
+        Returns:
+        -------
+        new : bool
+            True if path was not registered before
+        '''
+        if path in self._registered:
+            return False
+        self._registered.add(path)
+        return True
+
+    def write(self, path, data):
+        '''
+        Queue data to be appended to file path.
+        '''
+        if self._thread is None:
+            self._start()
+        self._queue.put(('write', path, data))
+
+    def _wait(self, op, path=None):
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put((op, path, done))
+        # Do not wait for a writer thread that is gone
+        while not done.wait(0.1):
+            if not self._thread.is_alive():
+                return
+
+    def flush(self):
+        '''
+        Block until all queued data is written to disk.
+        '''
+        self._wait('flush')
+
+    def close(self, path=None):
+        '''
+        Write the queued data and close file path, or all files if path is None.
+        The file is reopened if written again.
+        '''
+        self._wait('close', path)
+        if path is None:
+            self._registered.clear()
+        else:
+            self._registered.discard(path)
+
+    def _before_fork(self):
+        # Empty the buffers, so that the child does not write them again
+        self.flush()
+
+    def _after_fork(self):
+        # The writer thread does not exist in a forked child
+        self._reset()
+
+log_sink.sink = log_sink()
+atexit.register(log_sink.sink.close)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=log_sink.sink._before_fork,
+            after_in_child=log_sink.sink._after_fork)
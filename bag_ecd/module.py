@@ -1,3 +1,6 @@
+from bag_ecd import bag_startup
+bag_startup.init_framework()
+
 from bag.design import Module
 from bag.math import float_to_si_string
 
@@ -0,0 +1,172 @@
+'''
+BAG ECD --- offline_backend.py
+
+Generation without Virtuoso.
+
+The offline backend replaces the methods of a BagProject that talk to the
+Virtuoso skill server with ones that record their payloads to a local
+database directory:
+
+    import_design_library     No-op. The schematic generators in BagModules
+                              must already exist, e.g. from a previous online
+                              import or from version control.
+    instantiate_layout        Layout content of the cells
+    instantiate_layout_pcell  Parameters of the cell
+    instantiate_schematic     Schematic content of the cells
+
+Each recorded call is pickled to <directory>/<library>/<seq>_<pid>_<method>.pkl
+and listed in <directory>/index.jsonl with the library, cell names and
+time of the call. The records can be read back with offline_backend.load,
+e.g. to compare generated layouts between revisions.
+
+Templates must be instantiated with use_cybagoa=False, so that the layouts
+are passed to BagProject.instantiate_layout instead of being written to
+OpenAccess directly.
+
+'''
+import os
+import json
+import time
+import pickle
+import shutil
+import threading
+from bag_ecd.session_pool import session_pool, bag_project_factory
+
+class offline_backend():
+    '''
+    Offline backend recording to a database directory. Use offline_backend.get
+    to share one backend per directory.
+
+    Parameters:
+
+    directory : str
+        Database directory. Default: environment variable BAG_ECD_OFFLINE_DIR
+        or ./offline_db
+
+    '''
+    #Recorded BagProject methods, and functions returning the cell names from their
+    #arguments after lib_name
+    METHODS = { 
+            'instantiate_layout' : lambda args: [ item[0] for item in args[2] ],
+            'instantiate_layout_pcell' : lambda args: [ args[0] ],
+            'instantiate_schematic' : lambda args: [ item[0] for item in args[0] ],
+            }
+
+    _backends = {}
+    _backends_lock = threading.Lock()
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.environ.get('BAG_ECD_OFFLINE_DIR', os.path.join(os.getcwd(), 'offline_db'))
+        self.directory = os.path.realpath(directory)
+        self.pool = session_pool(factory=self.project, health_check=lambda project: True)
+        self._lock = threading.Lock()
+        self._seq = None
+
+    @classmethod
+    def get(cls, directory=None):
+        ''' Shared backend of directory '''
+        backend = cls(directory)
+        with cls._backends_lock:
+            return cls._backends.setdefault(backend.directory, backend)
+
+    @property
+    def index_file(self):
+        ''' Index of the recorded calls, one JSON object per line '''
+        return os.path.join(self.directory, 'index.jsonl')
+
+    def project(self, endpoint):
+        '''
+        Session factory of the backend: BagProject of endpoint with attach applied.
+        Without a running skill server, BagProject has no database interface,
+        which is not needed offline.
+        '''
+        return self.attach(bag_project_factory(endpoint))
+
+    def attach(self, project):
+        '''
+        Replace the Virtuoso methods of project with recording ones. Returns project.
+        '''
+        project.import_design_library = self._import_design_library
+        for method in self.METHODS:
+            setattr(project, method, self._recorder(method))
+        project.offline_backend = self
+        return project
+
+    def _import_design_library(self, lib_name):
+        self.record('import_design_library', lib_name, [], (lib_name,), {})
+
+    def _recorder(self, method):
+        cells = self.METHODS[method]
+        def record(lib_name, *args, **kwargs):
+            self.record(method, lib_name, cells(args), (lib_name,)+args, kwargs)
+        record.__name__ = method
+        return record
+
+    def _next_seq(self):
+        # Continue numbering of an existing database
+        if self._seq is None:
+            self._seq = sum(1 for record in self.index())
+        self._seq += 1
+        return self._seq
+
+    def record(self, method, lib_name, cells, args, kwargs):
+        '''
+        Store a call of method with the given arguments to the database.
+
+        Returns:
+        -------
+        entry : Dict[str, Any]
+            Index entry of the call
+        '''
+        with self._lock:
+            seq = self._next_seq()
+            libdir = os.path.join(self.directory, lib_name)
+            os.makedirs(libdir, exist_ok=True)
+            fname = os.path.join(libdir, '%06d_%d_%s.pkl' % (seq, os.getpid(), method))
+            with open(fname, 'wb') as f:
+                pickle.dump({ 'method' : method, 'args' : args, 'kwargs' : kwargs }, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            entry = { 'seq' : seq, 'method' : method, 'library' : lib_name, 'cells' : [ str(cell) for cell in cells ],
+                    'file' : os.path.relpath(fname, self.directory), 'time' : time.time(), 'pid' : os.getpid() }
+            with open(self.index_file, 'a') as f:
+                f.write(json.dumps(entry)+'\n')
+        return entry
+
+    def index(self):
+        ''' Iterate over the index entries of the recorded calls in recording order '''
+        try:
+            with open(self.index_file, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        except OSError:
+            return
+
+    def load(self, method=None, lib_name=None, cell_name=None):
+        '''
+        Recorded calls matching the given method, library and cell name (None matches all).
+
+        Returns:
+        -------
+        records : List[Dict[str, Any]]
+            Index entries with the additional keys 'args' and 'kwargs' of the call
+        '''
+        records = []
+        for entry in self.index():
+            if method is not None and entry['method'] != method:
+                continue
+            if lib_name is not None and entry['library'] != lib_name:
+                continue
+            if cell_name is not None and cell_name not in entry['cells']:
+                continue
+            with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+                entry.update(pickle.load(f))
+            records.append(entry)
+        return records
+
+    def clear(self):
+        ''' Remove all recorded calls of the database '''
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self._seq = None
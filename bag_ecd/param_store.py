@@ -0,0 +1,273 @@
+'''
+BAG ECD --- param_store.py
+
+Append-only store of generated variants.
+
+Each variant is one JSON line in the store file, with its layout and
+schematic parameters, cell and library names, timings, and the hash of
+its layout parameters (see fingerprint.stable_hash). Records are appended
+as they are generated, so an interrupted sweep keeps everything generated
+before the interruption.
+
+A sidecar index file, <store>.idx, lists for every record its parameter
+hash, byte offset and length in the store, a digest of its results and its
+run. Lookups by parameter hash seek directly to the record, and two runs,
+in the same store or in two stores, are compared from the indexes only.
+Records appended without updating the index, e.g. by an interrupted
+process, are indexed when the store is opened. Records appended by other
+processes while the store is open, e.g. by generate_parallel, are indexed
+when the store has grown at the next lookup.
+
+'''
+import os
+import json
+import time
+import threading
+from bag_ecd.fingerprint import stable_hash
+
+class param_store():
+    '''
+    Store of generated variants in the JSON lines file fname.
+
+    Parameters:
+
+    fname : str
+        Store file. Created on the first append.
+    run : str
+        Identifier of the run added to the records appended through this
+        object. Default: start time and process id
+
+    '''
+    #Fields of a record that make up its result digest
+    RESULT_FIELDS = ( 'cell', 'library', 'sch_params' )
+
+    def __init__(self, fname, run=None):
+        self.fname = os.path.realpath(fname)
+        self.index_file = self.fname + '.idx'
+        self.run = run if run is not None else '%s_%d' % (time.strftime('%Y%m%d%H%M%S'), os.getpid())
+        self._lock = threading.Lock()
+        self._index = None
+        # Offsets of the indexed records, and end of the scanned part of the store
+        self._offsets = set()
+        self._end = 0
+
+    @staticmethod
+    def param_hash(layout_params):
+        ''' Hash of layout parameters, the lookup key of the store '''
+        return stable_hash(layout_params)
+
+    @classmethod
+    def result_digest(cls, record):
+        ''' Hash of the results of record, compared by diff '''
+        return stable_hash({ field : record.get(field) for field in cls.RESULT_FIELDS })
+
+    def _add(self, index, key, entry):
+        # Add entry (offset, length, digest, run) of parameter hash key, unless indexed before
+        if entry[0] in self._offsets:
+            return False
+        self._offsets.add(entry[0])
+        index.setdefault(key, []).append(entry)
+        return True
+
+    def _scan(self, index, write=False):
+        '''
+        Index the complete records of the store after the scanned part. With write=True,
+        their entries are also appended to the index file.
+        '''
+        if not os.path.isfile(self.fname) or os.path.getsize(self.fname) <= self._end:
+            return
+        added = []
+        with open(self.fname, 'rb') as f:
+            f.seek(self._end)
+            offset = self._end
+            for line in f:
+                if not line.endswith(b'\n'): # Partially written last record
+                    break
+                if line.strip():
+                    record = json.loads(line)
+                    entry = (offset, len(line), self.result_digest(record), record.get('run'))
+                    if self._add(index, record['hash'], entry):
+                        added.append((record['hash'], entry))
+                offset += len(line)
+            self._end = offset
+        if write and added:
+            with open(self.index_file, 'a') as idx:
+                idx.writelines(json.dumps([ key, *entry ])+'\n' for key, entry in added)
+        # Records are appended in order, unless appended concurrently
+        for key in set(key for key, entry in added):
+            index[key].sort()
+
+    def _load_index(self):
+        '''
+        Read the index and index the records appended after it. Returns a dict
+        from parameter hash to list of (offset, length, digest, run).
+        '''
+        index = {}
+        covered = 0
+        try:
+            with open(self.index_file, 'r') as f:
+                lines = f.readlines()
+        except OSError:
+            lines = []
+        legacy = []
+        for line in lines:
+            try:
+                key, offset, length, digest, *run = json.loads(line)
+            except ValueError: # Partially written last line, the record is indexed again below
+                continue
+            if run:
+                self._add(index, key, (offset, length, digest, run[0]))
+            else: # Index written without runs
+                legacy.append((key, offset, length, digest))
+            covered = max(covered, offset + length)
+        if legacy:
+            with open(self.fname, 'rb') as f:
+                for key, offset, length, digest in legacy:
+                    self._add(index, key, (offset, length, digest, self._read(f, offset, length).get('run')))
+        if lines and not lines[-1].endswith('\n'):
+            with open(self.index_file, 'a') as idx:
+                idx.write('\n')
+        self._end = covered
+        self._scan(index, write=True)
+        return index
+
+    @property
+    def index(self):
+        ''' Parameter hash : list of (offset, length, result digest, run) of the records '''
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            else:
+                self._scan(self._index)
+        return self._index
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.index.values())
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def append(self, layout_params, sch_params=None, cell=None, library=None, timings=None, **extra):
+        '''
+        Append a record of a generated variant.
+
+        Returns:
+        -------
+        record : Dict[str, Any]
+        '''
+        record = { 'hash' : self.param_hash(layout_params), 'run' : self.run, 'time' : time.time(),
+                'cell' : cell, 'library' : library, 'layout_params' : layout_params,
+                'sch_params' : sch_params, 'timings' : timings or {} }
+        record.update(extra)
+        line = (json.dumps(record, default=repr)+'\n').encode()
+        index = self.index
+        with self._lock:
+            dirname = os.path.dirname(self.fname)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            # Offset from the end of the write, in case other processes append to the store
+            with open(self.fname, 'ab', buffering=0) as f:
+                f.write(line)
+                offset = f.tell() - len(line)
+            entry = (offset, len(line), self.result_digest(json.loads(line)), self.run)
+            with open(self.index_file, 'a') as idx:
+                idx.write(json.dumps([ record['hash'], *entry ])+'\n')
+            self._add(index, record['hash'], entry)
+            if offset == self._end:
+                self._end += len(line)
+        return record
+
+    def _read(self, f, offset, length):
+        f.seek(offset)
+        return json.loads(f.read(length))
+
+    def get(self, key, latest=True):
+        '''
+        Records with parameter hash key, or the latest of them if latest is True.
+        key may also be a dictionary of layout parameters.
+        Returns None (latest) or an empty list if there is none.
+        '''
+        if isinstance(key, dict):
+            key = self.param_hash(key)
+        entries = self.index.get(key, [])
+        if not entries:
+            return None if latest else []
+        if latest:
+            entries = entries[-1:]
+        with open(self.fname, 'rb') as f:
+            records = [ self._read(f, offset, length) for offset, length, digest, run in entries ]
+        return records[0] if latest else records
+
+    def __iter__(self):
+        ''' Iterate over the records in the order they were appended '''
+        try:
+            f = open(self.fname, 'rb')
+        except OSError:
+            return
+        with f:
+            for line in f:
+                if line.endswith(b'\n') and line.strip():
+                    yield json.loads(line)
+
+    def records(self, run=None):
+        ''' Iterate over the records of run, default: all '''
+        for record in self:
+            if run is None or record.get('run') == run:
+                yield record
+
+    def runs(self):
+        ''' Identifiers of the runs of the store, in the order of their first records '''
+        runs = {}
+        for entries in self.index.values():
+            for offset, length, digest, run in entries:
+                runs[run] = min(offset, runs.get(run, offset))
+        return sorted(runs, key=runs.get)
+
+    def latest(self, run=None):
+        '''
+        Parameter hash : result digest of the latest record of each parameter hash,
+        considering only the records of run, if given.
+        '''
+        latest = {}
+        for key, entries in self.index.items():
+            for offset, length, digest, entry_run in reversed(entries):
+                if run is None or entry_run == run:
+                    latest[key] = digest
+                    break
+        return latest
+
+    def diff(self, other=None, run=None, other_run=None):
+        '''
+        Compare the latest records of the parameter hashes of this store to those of other,
+        e.g. the store of a previous run. Only the indexes are read.
+
+        Parameters:
+        -------
+        other : Union[param_store, str, None]
+            Store, or its file, to compare to. Default: this store, to compare two of its runs
+        run : Union[str, None]
+            Compare only the records of this run of this store. Default: all
+        other_run : Union[str, None]
+            Compare only the records of this run of other. Default: all
+
+        Returns:
+        -------
+        diff : Dict[str, List[str]]
+            Parameter hashes 'added' (only in this store), 'removed' (only in other),
+            'changed' (different results) and 'unchanged'.
+        '''
+        if other is None:
+            other = self
+        elif not isinstance(other, param_store):
+            other = param_store(other)
+        mine, theirs = self.latest(run), other.latest(other_run)
+        diff = { 'added' : [], 'removed' : [], 'changed' : [], 'unchanged' : [] }
+        for key, digest in mine.items():
+            if key not in theirs:
+                diff['added'].append(key)
+            elif theirs[key] != digest:
+                diff['changed'].append(key)
+            else:
+                diff['unchanged'].append(key)
+        diff['removed'] = [ key for key in theirs if key not in mine ]
+        return diff
@@ -0,0 +1,107 @@
+'''
+BAG ECD --- pipeline.py
+
+Ordered two-stage pipeline.
+
+The producer (the calling thread) puts jobs to a bounded queue, and a single
+worker thread runs the consumer stage on them in the order they were put.
+The producer can thus prepare job i+1 while the worker processes job i,
+e.g. compute the next layout template in Python while the previous one is
+written to Virtuoso. The queue bound limits how far the producer can run
+ahead, and thus the memory held by queued jobs.
+
+In batch mode, the worker takes all jobs queued at once and runs the stage
+on them together, e.g. to write the layouts of several variants in one
+transaction. Batches grow when the consumer is the slower stage.
+
+An exception in the worker stops the pipeline and is raised in the
+producer at its next put or at close.
+
+'''
+import queue
+import threading
+
+class ordered_pipeline():
+    '''
+    Worker thread running stage(job) for each job put to the pipeline, in order.
+
+    Parameters:
+
+    stage : Callable[[Any], Any]
+        Consumer stage. The return values are collected to results.
+        In batch mode, called with a list of jobs and returns a list of results.
+    depth : int
+        Maximum number of queued jobs not yet taken by the worker. Default: 1
+    name : str
+        Name of the worker thread
+    batch : bool
+        Run the stage on all queued jobs at once. Default: False
+
+    '''
+    _STOP = object()
+
+    def __init__(self, stage, depth=1, name='bag_ecd-pipeline', batch=False):
+        self.stage = stage
+        self.batch = batch
+        self.results = []
+        self._queue = queue.Queue(maxsize=max(depth, 1))
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is self._STOP:
+                return
+            jobs = [ job ]
+            stop = False
+            while self.batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is self._STOP:
+                    stop = True
+                    break
+                jobs.append(job)
+            if self._error is None: # Drain after failure
+                try:
+                    if self.batch:
+                        self.results.extend(self.stage(jobs))
+                    else:
+                        self.results.append(self.stage(jobs[0]))
+                except BaseException as e:
+                    self._error = e
+            if stop:
+                return
+
+    def check(self):
+        ''' Raise the exception of the worker, if any '''
+        if self._error is not None:
+            raise self._error
+
+    def put(self, job):
+        ''' Queue job, blocking while the queue is full '''
+        self.check()
+        self._queue.put(job)
+
+    def close(self, check=True):
+        '''
+        Wait until the queued jobs are done and stop the worker. Raises the exception
+        of the worker if check is True.
+        '''
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        if check:
+            self.check()
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # Do not mask an exception of the producer
+        self.close(check=exc_type is None)
+        return False
@@ -9,6 +9,708 @@ Created on 09.03.2021 by Santeri Porrasmaa, santeri.porrasmaa@aalto.fi
 '''
 
 import numpy as np
+import math
+import re
+import fnmatch
+
+class spatial_index():
+    '''
+    Uniform grid index of rectangles, e.g. instance bounding boxes. Each item 
+    is stored in every grid cell its box overlaps, so queries only test the
+    items in the cells around the query.
+
+    Parameters:
+
+    resolution : float
+        Layout resolution, used to convert coordinates given in layout units
+    cell_size : Union[int, None]
+        Size of the grid cells in resolution units. Default: chosen from the
+        sizes of the initial items
+    items : Iter[Any]
+        Initial items, e.g. instances. Their boxes are read from item.bound_box.
+
+    Boxes are given as (left, bottom, right, top) tuples or objects with a
+    get_bounds method (e.g. bag.layout.util.BBox). Methods with a unit_mode
+    parameter take and return coordinates in resolution units if it is true,
+    else in layout units.
+
+    '''
+    def __init__(self, resolution, cell_size=None, items=()):
+        self.resolution = resolution
+        self._boxes = {}
+        self._items = {}
+        self._cells = {}
+        # Number of occupied cells per cell column and row, and their extent
+        self._xcount = {}
+        self._ycount = {}
+        self._extent = None
+        entries = [(item, self._item_box(item)) for item in items]
+        if cell_size is None:
+            sizes = sorted(max(box[2]-box[0], box[3]-box[1]) for item, box in entries)
+            cell_size = sizes[len(sizes) // 2] if sizes else 1000
+        self.cell_size = max(int(cell_size), 1)
+        for item, box in entries:
+            self._insert(item, box)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return id(item) in self._items
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def _item_box(self, item):
+        return tuple(int(coord) for coord in item.bound_box.get_bounds(unit_mode=True))
+
+    def _box(self, box, unit_mode):
+        ''' Box in resolution units '''
+        if hasattr(box, 'get_bounds'):
+            return tuple(int(coord) for coord in box.get_bounds(unit_mode=True))
+        if unit_mode:
+            return tuple(int(coord) for coord in box)
+        return tuple(int(round(coord / self.resolution)) for coord in box)
+
+    def _cell_range(self, box):
+        size = self.cell_size
+        return (range(box[0] // size, box[2] // size + 1), range(box[1] // size, box[3] // size + 1))
+
+    def _insert(self, item, box):
+        key = id(item)
+        self._items[key] = item
+        self._boxes[key] = box
+        xcells, ycells = self._cell_range(box)
+        for cx in xcells:
+            for cy in ycells:
+                cell = self._cells.get((cx, cy))
+                if cell is None:
+                    cell = self._cells[(cx, cy)] = set()
+                    self._occupy(cx, cy)
+                cell.add(key)
+
+    def _occupy(self, cx, cy):
+        self._xcount[cx] = self._xcount.get(cx, 0) + 1
+        self._ycount[cy] = self._ycount.get(cy, 0) + 1
+        if self._extent is not None:
+            x0, x1, y0, y1 = self._extent
+            self._extent = (min(x0, cx), max(x1, cx), min(y0, cy), max(y1, cy))
+
+    def _vacate(self, cx, cy):
+        for count, coord, bounds in ((self._xcount, cx, 0), (self._ycount, cy, 2)):
+            count[coord] -= 1
+            if not count[coord]:
+                del count[coord]
+                # The extent shrinks, recomputed from the occupied columns and rows on demand
+                if self._extent is not None and coord in self._extent[bounds:bounds + 2]:
+                    self._extent = None
+
+    def _occupied_extent(self):
+        ''' (min cx, max cx, min cy, max cy) of the occupied cells '''
+        if self._extent is None and self._xcount:
+            self._extent = (min(self._xcount), max(self._xcount), min(self._ycount), max(self._ycount))
+        return self._extent
+
+    def add(self, item, box=None, unit_mode=False):
+        '''
+        Add item with box (default: its bounding box). Adding an item again updates its box.
+        '''
+        box = self._item_box(item) if box is None else self._box(box, unit_mode)
+        if id(item) in self._items:
+            self.remove(item)
+        self._insert(item, box)
+
+    def update(self, item):
+        ''' Re-read the bounding box of item, e.g. after moving it '''
+        self.add(item)
+
+    def remove(self, item):
+        ''' Remove item from the index '''
+        key = id(item)
+        box = self._boxes.pop(key)
+        del self._items[key]
+        xcells, ycells = self._cell_range(box)
+        for cx in xcells:
+            for cy in ycells:
+                cell = self._cells[(cx, cy)]
+                cell.discard(key)
+                if not cell:
+                    del self._cells[(cx, cy)]
+                    self._vacate(cx, cy)
+
+    def bounds(self, item, unit_mode=False):
+        ''' Box of item in the index '''
+        box = self._boxes[id(item)]
+        return box if unit_mode else tuple(coord * self.resolution for coord in box)
+
+    def _candidates(self, box):
+        xcells, ycells = self._cell_range(box)
+        # Few items: scanning them is cheaper than the cells
+        if len(xcells) * len(ycells) > len(self._items):
+            return list(self._boxes)
+        keys = set()
+        for cx in xcells:
+            for cy in ycells:
+                keys.update(self._cells.get((cx, cy), ()))
+        return keys
+
+    def overlapping(self, box, unit_mode=False, touching=False):
+        '''
+        Items whose boxes overlap box. With touching=True, also items that
+        only share an edge or a corner with it.
+        '''
+        l, b, r, t = self._box(box, unit_mode)
+        ret = []
+        for key in self._candidates((l, b, r, t)):
+            bl, bb, br, bt = self._boxes[key]
+            if touching:
+                hit = bl <= r and l <= br and bb <= t and b <= bt
+            else:
+                hit = bl < r and l < br and bb < t and b < bt
+            if hit:
+                ret.append(self._items[key])
+        return ret
+
+    def inside(self, box, unit_mode=False):
+        ''' Items whose boxes are inside box '''
+        l, b, r, t = self._box(box, unit_mode)
+        return [self._items[key] for key in self._candidates((l, b, r, t)) 
+                if l <= self._boxes[key][0] and b <= self._boxes[key][1] 
+                and self._boxes[key][2] <= r and self._boxes[key][3] <= t]
+
+    def containing(self, box, unit_mode=False):
+        ''' Items whose boxes contain box. Give a point as a box of zero size. '''
+        l, b, r, t = self._box(box, unit_mode)
+        return [self._items[key] for key in self._candidates((l, b, r, t)) 
+                if self._boxes[key][0] <= l and self._boxes[key][1] <= b 
+                and r <= self._boxes[key][2] and t <= self._boxes[key][3]]
+
+    def is_free(self, box, unit_mode=False):
+        ''' True if no item overlaps box '''
+        return not self.overlapping(box, unit_mode)
+
+    _SIDES = {
+            'left' : lambda box, ref: box[2] <= ref[0],
+            'right' : lambda box, ref: box[0] >= ref[2],
+            'down' : lambda box, ref: box[3] <= ref[1],
+            'up' : lambda box, ref: box[1] >= ref[3],
+            }
+
+    def nearest(self, box, direction=None, k=1, unit_mode=False, excl_list=None):
+        '''
+        Items nearest to box (or a point given as a box of zero size) by the 
+        Euclidean distance between the boxes.
+
+        Parameters:
+        -------
+        box : Union[Tuple[int, int, int, int], bag.layout.util.BBox]
+            Reference box
+        direction : Union[str, None]
+            'left', 'right', 'up' or 'down': consider only items entirely on that
+            side of box. Default: all items
+        k : int
+            Number of items to return
+        unit_mode : boolean
+            Coordinates of box in resolution units if true
+        excl_list : Union[List[Any], None]
+            Items not to return, e.g. the item the reference box belongs to
+
+        Returns:
+        -------
+        items : List[Tuple[Any, float]]
+            Up to k nearest items and their distances, nearest first.
+            Distances are in the units given by unit_mode.
+        '''
+        ref = self._box(box, unit_mode)
+        side = self._SIDES[direction] if direction is not None else None
+        excl = {id(item) for item in excl_list or ()}
+        size = self.cell_size
+        xcells, ycells = self._cell_range(ref)
+        found = {}
+        if not self._items:
+            return []
+        # Extent of the occupied cells, to stop the search
+        x0, x1, y0, y1 = self._occupied_extent()
+        max_ring = max(xcells[0] - x0, x1 - xcells[-1], ycells[0] - y0, y1 - ycells[-1], 0)
+        ring = 0
+        while ring <= max_ring:
+            # Cells at Chebyshev distance ring from the cells of the reference box
+            x0, x1 = xcells[0] - ring, xcells[-1] + ring
+            y0, y1 = ycells[0] - ring, ycells[-1] + ring
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    if ring and x0 < cx < x1 and y0 < cy < y1:
+                        continue
+                    for key in self._cells.get((cx, cy), ()):
+                        if key in found or key in excl:
+                            continue
+                        other = self._boxes[key]
+                        if side is not None and not side(other, ref):
+                            continue
+                        dx = max(other[0] - ref[2], ref[0] - other[2], 0)
+                        dy = max(other[1] - ref[3], ref[1] - other[3], 0)
+                        found[key] = math.hypot(dx, dy)
+            # Items beyond this ring are at least ring cells away
+            best = sorted(found.values())[:k]
+            if len(best) == k and best[-1] <= ring * size:
+                break
+            ring += 1
+        ret = sorted(found.items(), key=lambda item: item[1])[:k]
+        scale = 1 if unit_mode else self.resolution
+        return [(self._items[key], dist * scale) for key, dist in ret]
+
+    def find_free(self, window, width, height, unit_mode=False):
+        '''
+        Lowest, then leftmost position in window where a box of size width x height
+        does not overlap any item. Candidate positions are the lower left corner of
+        the window and the right and top edges of the items.
+
+        Returns:
+        -------
+        box : Union[Tuple[int, int, int, int], None]
+            The free box, or None if there is no room in window
+        '''
+        l, b, r, t = self._box(window, unit_mode)
+        if unit_mode:
+            width, height = int(width), int(height)
+        else:
+            width, height = int(round(width / self.resolution)), int(round(height / self.resolution))
+        boxes = [self._boxes[key] for key in self._candidates((l, b, r, t))]
+        xs = sorted({l} | {box[2] for box in boxes if l <= box[2] <= r - width})
+        ys = sorted({b} | {box[3] for box in boxes if b <= box[3] <= t - height})
+        for y in ys:
+            for x in xs:
+                if x + width > r or y + height > t:
+                    continue
+                if self.is_free((x, y, x + width, y + height), unit_mode=True):
+                    box = (x, y, x + width, y + height)
+                    return box if unit_mode else tuple(coord * self.resolution for coord in box)
+        return None
+
+
+#Orientations of instances as the signs of x and y after the orientation
+ORIENTATIONS = {'R0' : (1, 1), 'MX' : (1, -1), 'MY' : (-1, 1), 'R180' : (-1, -1)}
+_SIGN_ORIENTATIONS = {signs : orient for orient, signs in ORIENTATIONS.items()}
+
+def instance_transform(inst):
+    '''
+    Transform of an instance: (sx, sy, dx, dy) mapping a point (x, y) of its master 
+    to (sx*x + dx, sy*y + dy) in its parent, in resolution units. For an instance
+    array, the transform of its first element, see array_offsets.
+    '''
+    orient = getattr(inst, 'orientation', 'R0')
+    if orient not in ORIENTATIONS:
+        raise ValueError('Orientation %s of instance %s is not supported' % (orient, inst._inst_name))
+    dx, dy = inst.location_unit
+    return ORIENTATIONS[orient] + (int(dx), int(dy))
+
+def array_offsets(inst):
+    '''
+    Offsets (dx, dy) of the elements of an instance array (nx columns and ny rows 
+    with pitches spx_unit and spy_unit) from its first element, in resolution units. 
+    Shape (nx*ny, 2), row by row. A single instance has the offset (0, 0).
+    '''
+    nx, ny = getattr(inst, 'nx', 1), getattr(inst, 'ny', 1)
+    if nx == 1 and ny == 1:
+        return np.zeros((1, 2), dtype=np.int64)
+    col, row = np.meshgrid(np.arange(nx, dtype=np.int64), np.arange(ny, dtype=np.int64))
+    return np.stack([col.ravel() * int(getattr(inst, 'spx_unit', 0)), 
+        row.ravel() * int(getattr(inst, 'spy_unit', 0))], axis=1)
+
+def array_names(name, inst):
+    '''
+    Names of the elements of an instance array, name[row,col] in the order of
+    array_offsets. The name of a single instance is name.
+    '''
+    nx, ny = getattr(inst, 'nx', 1), getattr(inst, 'ny', 1)
+    if nx == 1 and ny == 1:
+        return [name]
+    return ['%s[%d,%d]' % (name, row, col) for row in range(ny) for col in range(nx)]
+
+def compose_transform(parent, child):
+    ''' Transform of child transform followed by parent transform '''
+    psx, psy, pdx, pdy = parent
+    csx, csy, cdx, cdy = child
+    return (psx * csx, psy * csy, psx * cdx + pdx, psy * cdy + pdy)
+
+def transform_orientation(transform):
+    ''' Orientation name of a transform, e.g. 'MX' '''
+    return _SIGN_ORIENTATIONS[transform[:2]]
+
+#Identity transform
+IDENTITY = (1, 1, 0, 0)
+
+def _post_order(root, build, memo, memoize_root=True):
+    '''
+    Value of build(master, children, lookup) for the template root, computed for every 
+    master below root first, without recursion. children are the instances of master, 
+    and lookup(master) returns the value of a master below it. The values are memoized 
+    in memo by master id, except that of root if memoize_root is False.
+    '''
+    root_value = None
+    def lookup(master):
+        if master is root and not memoize_root:
+            return root_value
+        entry = memo.get(id(master))
+        # The master is kept referenced in the memo, so its id is not reused
+        return entry[1] if entry is not None and entry[0] is master else None
+    stack = [(root, None)]
+    while stack:
+        master, children = stack.pop()
+        if lookup(master) is not None:
+            continue
+        if children is None:
+            children = list(master.instance_iter())
+            stack.append((master, children))
+            stack.extend((inst.master, None) for inst in children if lookup(inst.master) is None)
+            continue
+        value = build(master, children, lookup)
+        if master is root and not memoize_root:
+            root_value = value
+        else:
+            memo[id(master)] = (master, value)
+    return lookup(root)
+
+class instance_index():
+    '''
+    Index of the instances in a template hierarchy by hierarchical path, e.g. 
+    'XTOP/XINV/XN0', and by instance name. Each instance is found with its 
+    transform relative to the top (see instance_transform), so its absolute 
+    location and orientation are known without walking the hierarchy.
+
+    The children of each master are listed once, with their names and 
+    transforms, and shared by all instances of that master. The first lookup 
+    of a path follows it through these lists, which costs O(depth), and the 
+    result is kept, so repeated lookups cost O(1). Once the tables of all 
+    paths and names (paths, names) are built when first used, every lookup is 
+    answered from them in O(1).
+    Unnamed instances get names #<n>, where n is their position in their master.
+
+    Parameters:
+
+    top : Union[bag.layout.template.TemplateBase, bag.layout.objects.Instance]
+        Template to index (e.g. self in a layout class), or an instance whose 
+        master is indexed, with transforms relative to the parent of the instance.
+    memo : Union[Dict[int, Tuple], None]
+        Children of masters by master id, shared between indices of the same
+        finalized masters. The top template itself is never memoized.
+
+    '''
+    def __init__(self, top, memo=None):
+        self._memo = memo if memo is not None else {}
+        if hasattr(top, 'master'):
+            self._top, self._transform = top.master, instance_transform(top)
+        else:
+            self._top, self._transform = top, IDENTITY
+        self._top_children = None
+        self._found = {}
+        self._paths = None
+        self._names = None
+
+    @staticmethod
+    def _list_children(master):
+        children = {}
+        for n, inst in enumerate(master.instance_iter()):
+            name = inst._inst_name if inst._inst_name is not None else '#%d' % n
+            children.setdefault(name, (inst, instance_transform(inst)))
+        return children
+
+    def _children(self, master):
+        ''' Name : (instance, transform relative to master) of the children of master '''
+        if master is self._top:
+            if self._top_children is None:
+                self._top_children = self._list_children(master)
+            return self._top_children
+        entry = self._memo.get(id(master))
+        # The master is kept referenced in the memo, so its id is not reused
+        if entry is None or entry[0] is not master:
+            entry = self._memo[id(master)] = (master, self._list_children(master))
+        return entry[1]
+
+    def _lookup(self, path):
+        ''' (instance, transform relative to the top) at path, or None '''
+        if self._paths is not None:
+            return self._paths.get(path)
+        if path in self._found:
+            return self._found[path]
+        master, trans, entry = self._top, self._transform, None
+        for name in path.split('/'):
+            entry = self._children(master).get(name)
+            if entry is None:
+                break
+            trans = compose_transform(trans, entry[1])
+            master = entry[0].master
+        found = self._found[path] = (entry[0], trans) if entry is not None else None
+        return found
+
+    def _build(self):
+        # Depth-first pre-order walk without recursion
+        paths = {}
+        names = {}
+        def expand(prefix, master, trans):
+            return [(prefix + name, name, inst, compose_transform(trans, inst_trans)) 
+                    for name, (inst, inst_trans) in reversed(list(self._children(master).items()))]
+        stack = expand('', self._top, self._transform)
+        while stack:
+            path, name, inst, trans = stack.pop()
+            paths[path] = (inst, trans)
+            names.setdefault(name, []).append(path)
+            stack.extend(expand(path + '/', inst.master, trans))
+        self._paths, self._names = paths, names
+        self._found = {}
+
+    @property
+    def paths(self):
+        ''' Hierarchical path : (instance, transform relative to the top) of all instances '''
+        if self._paths is None:
+            self._build()
+        return self._paths
+
+    @property
+    def names(self):
+        ''' Instance name : hierarchical paths of the instances with that name '''
+        if self._names is None:
+            self._build()
+        return self._names
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, path):
+        return self._lookup(path) is not None
+
+    def _get(self, path):
+        entry = self._lookup(path)
+        if entry is None:
+            raise KeyError(path)
+        return entry
+
+    def get(self, path):
+        '''
+        Instance at hierarchical path, e.g. 'XTOP/XINV', or None.
+        '''
+        entry = self._lookup(path)
+        return entry[0] if entry is not None else None
+
+    def find_name(self, name):
+        '''
+        Hierarchical paths of the instances named name, in depth-first order.
+        '''
+        return list(self.names.get(name, []))
+
+    def find(self, pattern, regex=False):
+        '''
+        Hierarchical paths matching a glob pattern (e.g. 'XTOP/*/XN?') or, with 
+        regex=True, a regular expression matching the whole path.
+        '''
+        if regex:
+            match = re.compile(pattern).fullmatch
+        else:
+            match = re.compile(fnmatch.translate(pattern)).match
+        return [path for path in self.paths if match(path)]
+
+    def transform(self, path):
+        ''' Transform (sx, sy, dx, dy) of the instance at path relative to the top '''
+        return self._get(path)[1]
+
+    def orientation(self, path):
+        ''' Orientation of the instance at path relative to the top '''
+        return transform_orientation(self._get(path)[1])
+
+    def location(self, path, unit_mode=False):
+        ''' Location of the instance at path relative to the top '''
+        inst, (_, _, dx, dy) = self._get(path)
+        if unit_mode:
+            return dx, dy
+        res = inst.master.grid.resolution
+        return dx * res, dy * res
+
+
+def master_shapes(master):
+    '''
+    Shapes of a template used by flat_geometry: the bounding boxes of its instances
+    and the pins of its ports, in the coordinates of the template.
+
+    Returns:
+    -------
+    shapes : List[Tuple[str, str, int, Tuple[int, int, int, int]]]
+        Kind ('instance' or 'pin'), name (instance name or port name), layer ID 
+        (-1 for instances) and box in resolution units of each shape
+    '''
+    shapes = []
+    for n, inst in enumerate(master.instance_iter()):
+        name = inst._inst_name if inst._inst_name is not None else '#%d' % n
+        shapes.append(('instance', name, -1, tuple(inst.bound_box.get_bounds(unit_mode=True))))
+    if hasattr(master, 'port_names_iter'):
+        for name in master.port_names_iter():
+            port = master.get_port(name)
+            for layer, pins in getattr(port, '_pin_dict', {}).items():
+                for pin in pins:
+                    if hasattr(pin, 'get_bbox_array'): # WireArray
+                        pin = pin.get_bbox_array(master.grid).get_overall_bbox()
+                    shapes.append(('pin', name, layer, tuple(pin.get_bounds(unit_mode=True))))
+    return shapes
+
+class flat_geometry():
+    '''
+    Flattened shapes of a template hierarchy as arrays, one row per shape.
+    Created with placement_helper.flatten.
+
+    Attributes:
+
+    paths : List[str]
+        Hierarchical paths of the templates the shapes belong to, '' for the top
+    names : List[str]
+        Names of the shapes, see master_shapes
+    path_id : np.ndarray
+        Index to paths of each shape
+    name_id : np.ndarray
+        Index to names of each shape
+    kind : np.ndarray
+        Index to KINDS of each shape
+    layer : np.ndarray
+        Layer ID of each shape, -1 for instance bounding boxes
+    box : np.ndarray
+        Absolute box of each shape in resolution units, shape (N, 4)
+    sx, sy : np.ndarray
+        Signs of x and y of the template of each shape relative to the top, see ORIENTATIONS
+
+    '''
+    KINDS = ('instance', 'pin')
+    FIELDS = ('path_id', 'name_id', 'kind', 'layer', 'box', 'sx', 'sy')
+
+    def __init__(self, paths, names, resolution, **fields):
+        self.paths = paths
+        self.names = names
+        self.resolution = resolution
+        for field in self.FIELDS:
+            setattr(self, field, fields[field])
+
+    def __len__(self):
+        return self.layer.shape[0]
+
+    @classmethod
+    def from_shapes(cls, shapes, resolution):
+        ''' Records of the shapes of master_shapes, all with path \'\' '''
+        names = sorted({shape[1] for shape in shapes})
+        name_index = {name : n for n, name in enumerate(names)}
+        count = len(shapes)
+        return cls([''], names, resolution, path_id=np.zeros(count, dtype=np.int32),
+                name_id=np.array([name_index[shape[1]] for shape in shapes], dtype=np.int32).reshape(count),
+                kind=np.array([cls.KINDS.index(shape[0]) for shape in shapes], dtype=np.int8).reshape(count),
+                layer=np.array([shape[2] for shape in shapes], dtype=np.int32).reshape(count),
+                box=np.array([shape[3] for shape in shapes], dtype=np.int64).reshape(count, 4),
+                sx=np.ones(count, dtype=np.int8), sy=np.ones(count, dtype=np.int8))
+
+    def transformed(self, name, transform, offsets=None, names=None):
+        '''
+        Records of an instance named name of the template of these records,
+        with the transform (sx, sy, dx, dy) of the instance applied.
+
+        For an instance array, offsets are the offsets (dx, dy) of its elements from 
+        the transform, shape (M, 2), and names the names of the elements 
+        (see array_offsets and array_names). The records of all elements are 
+        computed at once.
+        '''
+        sx, sy, dx, dy = transform
+        if offsets is None:
+            offsets, names = np.zeros((1, 2), dtype=np.int64), [name]
+        count = offsets.shape[0]
+        x = (self.box[:, 0::2] * sx + dx)[None, :, :] + offsets[:, 0, None, None]
+        y = (self.box[:, 1::2] * sy + dy)[None, :, :] + offsets[:, 1, None, None]
+        box = np.stack([x.min(axis=2), y.min(axis=2), x.max(axis=2), y.max(axis=2)], axis=2).reshape(-1, 4)
+        paths = [(element if path == '' else element + '/' + path) if element else path 
+                for element in names for path in self.paths]
+        path_id = (self.path_id[None, :] + len(self.paths) * np.arange(count, dtype=np.int32)[:, None]).reshape(-1)
+        tile = lambda values: np.tile(values, count)
+        return flat_geometry(paths, self.names, self.resolution, path_id=path_id, name_id=tile(self.name_id),
+                kind=tile(self.kind), layer=tile(self.layer), box=box, sx=tile(self.sx * sx), sy=tile(self.sy * sy))
+
+    @classmethod
+    def concatenate(cls, parts, resolution):
+        ''' Records of all parts, with the path and name tables merged '''
+        paths = []
+        name_index = {}
+        fields = {field : [] for field in cls.FIELDS}
+        for part in parts:
+            fields['path_id'].append(part.path_id + len(paths))
+            paths.extend(part.paths)
+            remap = np.array([name_index.setdefault(name, len(name_index)) for name in part.names], dtype=np.int32)
+            fields['name_id'].append(remap[part.name_id] if len(part.names) else part.name_id)
+            for field in ('kind', 'layer', 'box', 'sx', 'sy'):
+                fields[field].append(getattr(part, field))
+        names = list(name_index)
+        if not parts:
+            return cls.from_shapes([], resolution)
+        return cls(paths, names, resolution, **{ field : np.concatenate(values) for field, values in fields.items() })
+
+    def select(self, layer=None, window=None, mode='inside', kind=None, name=None, path=None, unit_mode=False):
+        '''
+        Indices of the shapes matching all given conditions.
+
+        Parameters:
+        -------
+        layer : Union[int, List[int], None]
+            Layer ID(s) of the shapes
+        window : Union[Tuple[int, int, int, int], bag.layout.util.BBox, None]
+            Shapes inside (mode='inside') or overlapping (mode='overlap') the window
+        kind : Union[str, None]
+            'instance' or 'pin'
+        name : Union[str, None]
+            Port or instance name, glob patterns allowed
+        path : Union[str, None]
+            Hierarchical path of the template of the shapes, glob patterns allowed
+        unit_mode : boolean
+            Window in resolution units if true, else in layout units
+
+        Returns:
+        -------
+        index : np.ndarray
+        '''
+        mask = np.ones(len(self), dtype=bool)
+        if layer is not None:
+            mask &= np.isin(self.layer, np.atleast_1d(layer))
+        if kind is not None:
+            mask &= self.kind == self.KINDS.index(kind)
+        if name is not None:
+            ids = [n for n, item in enumerate(self.names) if fnmatch.fnmatchcase(item, name)]
+            mask &= np.isin(self.name_id, ids)
+        if path is not None:
+            ids = [n for n, item in enumerate(self.paths) if fnmatch.fnmatchcase(item, path)]
+            mask &= np.isin(self.path_id, ids)
+        if window is not None:
+            if hasattr(window, 'get_bounds'):
+                l, b, r, t = window.get_bounds(unit_mode=True)
+            elif unit_mode:
+                l, b, r, t = window
+            else:
+                l, b, r, t = [int(round(coord / self.resolution)) for coord in window]
+            box = self.box
+            if mode == 'inside':
+                mask &= (box[:, 0] >= l) & (box[:, 1] >= b) & (box[:, 2] <= r) & (box[:, 3] <= t)
+            elif mode == 'overlap':
+                mask &= (box[:, 0] < r) & (box[:, 2] > l) & (box[:, 1] < t) & (box[:, 3] > b)
+            else:
+                raise ValueError('Unknown window mode %s, choose inside or overlap' % (mode))
+        return np.nonzero(mask)[0]
+
+    def boxes(self, index=None, unit_mode=False):
+        ''' Boxes of the shapes at index (default: all), shape (N, 4) '''
+        box = self.box if index is None else self.box[index]
+        return box if unit_mode else box * self.resolution
+
+    def records(self, index=None, unit_mode=False):
+        '''
+        Shapes at index (default: all) as dictionaries with keys path, name, kind, 
+        layer, box and orientation.
+        '''
+        if index is None:
+            index = range(len(self))
+        return [{ 'path' : self.paths[self.path_id[n]], 'name' : self.names[self.name_id[n]],
+            'kind' : self.KINDS[self.kind[n]], 'layer' : int(self.layer[n]),
+            'box' : tuple(self.boxes(n, unit_mode).tolist()),
+            'orientation' : _SIGN_ORIENTATIONS[(int(self.sx[n]), int(self.sy[n]))] } for n in index]
+
 
 class placement_helper():
     '''
@@ -22,6 +724,62 @@ class placement_helper():
     '''
     def __init__(self, grid):
         self._grid = grid 
+        # Layer or tuple of layers : (direction, pitch, half pitch), see grid_pitch
+        self._pitch_cache = {}
+        # Instances below masters, see instance_index
+        self._master_index = {}
+        # Master id : (master, first instance below master by name), see _names_below
+        self._child_names = {}
+        # Master id : (master, flat_geometry of master), see flatten
+        self._flat_memo = {}
+
+    def _exclusion_ids(self, excl_list):
+        '''
+        Identities of the instances in excl_list, which is a list (or other iterable) of
+        instances, a single instance or None.
+        '''
+        if excl_list is None:
+            return set()
+        # Instances are recognized by their bounding box, lists by iterability
+        if hasattr(excl_list, 'bound_box'):
+            return { id(excl_list) }
+        try:
+            return { id(inst) for inst in excl_list }
+        except TypeError:
+            raise ValueError("excl_list should be a list of instances or a singular instance (bag.layout.objects.Instace) ")
+
+    def get_bounds_array(self, instance_iter, excl_list=None):
+        '''
+        Bounding boxes of instances as an array in resolution units.
+
+        Parameters:
+        -------
+        instance_iter : Iter[bag.layout.objects.Instance]
+            Iterator of instances
+        excl_list : Union[List[bag.layout.objects.Instance], bag.layout.objects.Instance, None]
+            Instances to leave out
+
+        Returns:
+        -------
+        instances : List[bag.layout.objects.Instance]
+            The instances that were not excluded
+        bounds : np.ndarray
+            Integer array of shape (N, 4): left, bottom, right and top of the
+            bounding box of each instance
+        '''
+        excl_ids = self._exclusion_ids(excl_list)
+        instances = [inst for inst in instance_iter if id(inst) not in excl_ids]
+        bounds = np.array([inst.bound_box.get_bounds(unit_mode=True) for inst in instances], 
+                dtype=np.int64).reshape(-1, 4)
+        return instances, bounds
+
+    def _edges(self, bounds, unit_mode):
+        if bounds.shape[0] == 0:
+            raise ValueError('No instances to find the edge coordinates of!')
+        edges = [bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()]
+        if unit_mode:
+            return [int(edge) for edge in edges]
+        return [int(edge) * self._grid.resolution for edge in edges]
 
     def get_edge_coord(self, instance_iter, excl_list=[],unit_mode=False):
         '''
@@ -46,23 +804,120 @@ class placement_helper():
         edges: Tuple[int, int, int, int]
             Tuple of left, bottom, right and top edge coordinates
         ''' 
-        # Check if excl_list is of correct type
-        if not isinstance(excl_list, list):
-            if isinstance(excl_list, Instance):
-                excl_list = [excl_list]
+        _, bounds = self.get_bounds_array(instance_iter, excl_list)
+        return self._edges(bounds, unit_mode)
+
+    def get_edge_coords(self, instance_iter, subsets, excl_list=[], unit_mode=False):
+        '''
+        Edge coordinates of several subsets of the instances at once. The bounding
+        boxes are read once for all subsets.
+
+        Parameters:
+        -------
+        instance_iter : Iter[bag.layout.objects.Insntance]
+            Iterator of instances in the current template
+        subsets : List[List[bag.layout.objects.Instance]]
+            Instances of each subset. Instances not given by instance_iter
+            or excluded with excl_list are ignored.
+        excl_list : List[bag.layout.objects.Instance]
+            List of instances to be excluded from all subsets.
+        unit_mode : boolean
+            Return edge coordinates in resolution units if true.
+            Else, return in layout units.
+
+        Returns:
+        -------
+        edges: List[Union[List[int], None]]
+            Left, bottom, right and top edge coordinates of each subset, None
+            for subsets without instances
+        '''
+        instances, bounds = self.get_bounds_array(instance_iter, excl_list)
+        rows = {id(inst) : row for row, inst in enumerate(instances)}
+        ret = []
+        for subset in subsets:
+            index = [rows[id(inst)] for inst in subset if id(inst) in rows]
+            ret.append(self._edges(bounds[index], unit_mode) if index else None)
+        return ret
+
+    def spatial_index(self, instance_iter, excl_list=None, cell_size=None):
+        '''
+        Spatial index of the bounding boxes of instances, for overlap, containment,
+        nearest neighbour and free space queries. Add instances placed later with 
+        spatial_index.add, and update moved instances with spatial_index.update.
+
+        Parameters:
+        -------
+        instance_iter : Iter[bag.layout.objects.Instance]
+            Iterator of instances in the current template
+            (e.g. self.instance_iter() in layout class)
+        excl_list : List[bag.layout.objects.Instance]
+            Instances to leave out of the index
+        cell_size : Union[int, None]
+            Grid cell size of the index in resolution units, see spatial_index
+
+        Returns:
+        -------
+        index : spatial_index
+        '''
+        excl_ids = self._exclusion_ids(excl_list)
+        return spatial_index(self._grid.resolution, cell_size=cell_size, 
+                items=[inst for inst in instance_iter if id(inst) not in excl_ids])
+
+    def grid_pitch(self, layer, half_track=False):
+        '''
+        Direction and pitch in resolution units of the grid used by coord_to_grid on
+        the given layer(s). Cached per helper, the grid is queried once per layer 
+        or list of layers.
+
+        Parameters:
+        -------
+        layer : Union[int, List[int]]
+            Layer ID or a list of layer IDs, see coord_to_grid
+        half_track : boolean
+            Return the pitch of half integer tracks
+
+        Returns:
+        -------
+        direction : str
+            Direction of the layer(s), 'x' or 'y'
+        pitch : int
+            Pitch of the layer, or least common multiple of the pitches of the layers
+        '''
+        key = tuple(layer) if isinstance(layer, (list, tuple)) else layer
+        entry = self._pitch_cache.get(key)
+        if entry is None:
+            grid = self._grid
+            if not isinstance(layer, (list, tuple)):
+                direction = grid.get_direction(layer)
+                pitch = grid.get_size_pitch(layer,unit_mode=True)[1 if direction == 'x' else 0]
+                entry = (direction, pitch, pitch // 2)
             else:
-                raise ValueError("excl_list should be a list of instances or a singular instance (bag.layout.objects.Instace) ")
-        # Loop over instances, store edge coords in list 
-        edges = [[] for i in range(0, 4)]
-        for inst in instance_iter:
-            if not inst in excl_list:
-                bounds = inst.bound_box.get_bounds(unit_mode)
-                for edge, coord in zip(edges, bounds):
-                    edge.append(coord)
-        # Return edge coords
-        edges = [min(edges[0]), min(edges[1]), max(edges[2]), max(edges[3])]
-        return edges 
+                # Check given layers are oriented in the same direction
+                dirs = [grid.get_direction(lay) for lay in layer] 
+                if len(set(dirs)) != 1:
+                    raise ValueError('All layers in the list must be of same direction!')
+                pitch = [grid.get_track_pitch(lay, unit_mode=True) for lay in layer]
+                entry = (dirs[0], int(np.lcm.reduce(pitch)), int(np.lcm.reduce([p // 2 for p in pitch])))
+            self._pitch_cache[key] = entry
+        return entry[0], (entry[2] if half_track else entry[1])
 
+    #Rounding modes of coord_to_grid
+    MODES = ('up', 'down', 'nearest')
+
+    def _snap(self, coord, pitch, mode):
+        '''
+        Round coord (int or integer array) to a multiple of pitch. Mode 'up' or >= 0 rounds up,
+        'down' or < 0 rounds down and 'nearest' to the nearest multiple, halves up.
+        '''
+        if not isinstance(mode, str):
+            mode = 'up' if mode >= 0 else 'down'
+        if mode == 'up':
+            return -(-coord // pitch) * pitch
+        elif mode == 'down':
+            return coord // pitch * pitch
+        elif mode == 'nearest':
+            return (coord + pitch // 2) // pitch * pitch
+        raise ValueError('Unknown rounding mode %s, choose one of %s or an integer.' % (mode, ', '.join(self.MODES)))
 
     def coord_to_grid(self, coord, layer, mode=0, half_track=False, unit_mode=False):
         '''
@@ -77,9 +932,9 @@ class placement_helper():
             coordinate layer ID or a list of layer IDs. If given as list,
             calculates coordinate so that coordinate is aligned to grid
             on all given layers
-        mode : int
+        mode : Union[int, str]
             Round coordinate up to nearest track multiple, if mode >= 0.
-            Else, round down.
+            Else, round down. Also 'up', 'down' or 'nearest'.
         half_track : boolean
             If true, use half integer tracks to calculate coordinate 
         unit_mode : boolean
@@ -91,49 +946,109 @@ class placement_helper():
             ret : int
             coordinate aligned with routing grid on the given layer
         '''
-        grid = self._grid
-        res = grid.resolution
-        if not isinstance(layer, list):
-            direction = grid.get_direction(layer)
-            if not unit_mode:
-                coord = round(coord / res)
-            if direction == 'x':
-                pitch = grid.get_size_pitch(layer,unit_mode=True)[1]
-                pitch = pitch // 2 if half_track else pitch
-                if coord % pitch != 0:
-                    ret= coord - (coord % pitch) if mode < 0 else coord + (pitch - (coord % pitch))
-                    return ret*res if not unit_mode else ret
-                else:
-                    return coord*res if not unit_mode else coord
-            else:
-                pitch = grid.get_size_pitch(layer,unit_mode=True)[0]
-                pitch = pitch // 2 if half_track else pitch
-                if coord % pitch != 0:
-                    ret = coord - (coord % pitch) if mode < 0 else coord + (pitch - (coord % pitch))
-                    return ret*res if not unit_mode else ret
-                else:
-                    return coord*res if not unit_mode else coord
+        res = self._grid.resolution
+        _, pitch = self.grid_pitch(layer, half_track)
+        if not unit_mode:
+            coord = round(coord / res)
+        ret = self._snap(coord, pitch, mode)
+        return ret if unit_mode else ret*res
+
+    def coords_to_grid(self, coords, layer, mode=0, half_track=False, unit_mode=False):
+        '''
+        Array version of coord_to_grid: align many coordinates with the grid at once.
+
+        Parameters:
+        -------
+        coords : Union[np.ndarray, List[Union[float, int]]]
+            x or y coordinates to be rounded to track multiples, any shape
+        layer : Union[int, List[int]]
+            coordinate layer ID or a list of layer IDs, see coord_to_grid
+        mode : Union[int, str]
+            'up' (or >= 0), 'down' (or < 0) or 'nearest'
+        half_track : boolean
+            If true, use half integer tracks to calculate coordinates
+        unit_mode : boolean
+            If true, coordinates were given (and are returned) in resolution units.
+            Else, coordinates were given (and are returned) in layout units.
+
+        Returns:
+        -------
+            ret : np.ndarray
+            coordinates aligned with routing grid on the given layer, integers 
+            if unit_mode is true
+        '''
+        res = self._grid.resolution
+        _, pitch = self.grid_pitch(layer, half_track)
+        coords = np.asarray(coords)
+        if unit_mode:
+            coords = coords.astype(np.int64)
         else:
-            # Check given layers are oriented in the same direction
-            dirs = [grid.get_direction(lay) for lay in layer] 
-            if len(set(dirs)) != 1:
-                raise ValueError('All layers in the list must be of same direction!')
-            pitch = [grid.get_track_pitch(lay, unit_mode=True) for lay in layer]
-            pitch = [p // 2 if half_track==True else p for p in pitch] 
-            pitch = np.lcm.reduce(pitch)
-            if not unit_mode:
-                coord = round(coord / res)
-            if coord % pitch != 0:
-                ret = coord - (coord % pitch) if mode < 0 else coord+(pitch-(coord%pitch))
-                return ret if unit_mode else ret*res
-            else:
-                return coord if unit_mode else coord*res
+            coords = np.rint(coords / res).astype(np.int64)
+        ret = self._snap(coords, pitch, mode)
+        return ret if unit_mode else ret*res
 
         
+    def instance_index(self, top):
+        '''
+        Index of the instances of a template hierarchy by hierarchical path and name,
+        see instance_index. The children of each master are listed once per helper, 
+        so the masters must not change after they have been indexed.
+
+        Parameters:
+        -------
+        top : Union[bag.layout.template.TemplateBase, bag.layout.objects.Instance]
+            Template (e.g. self in layout class) or instance to index
+
+        Returns:
+        -------
+        index : instance_index
+        '''
+        return instance_index(top, memo=self._master_index)
+
+    def flatten(self, top, shapes=master_shapes):
+        '''
+        Flatten the shapes of a template hierarchy to arrays with absolute boxes,
+        for fast global queries, e.g. 
+
+            flat = helper.flatten(self)
+            index = flat.select(layer=4, window=(0, 0, 10, 10), kind='pin')
+
+        Each master below top is flattened once per helper and reused for all its
+        instances, so the masters must not change after they have been flattened.
+        The elements of instance arrays are included, named name[row,col].
+
+        Parameters:
+        -------
+        top : Union[bag.layout.template.TemplateBase, bag.layout.objects.Instance]
+            Template (e.g. self in layout class) or instance to flatten. Boxes of 
+            an instance are relative to the parent of the instance.
+        shapes : Callable[[bag.layout.template.TemplateBase], List[Tuple]]
+            Shapes of a single template, see master_shapes
+
+        Returns:
+        -------
+        flat : flat_geometry
+        '''
+        if hasattr(top, 'master'):
+            root, transform = top.master, instance_transform(top)
+        else:
+            root, transform = top, IDENTITY
+        resolution = self._grid.resolution if self._grid is not None else root.grid.resolution
+        def build(master, children, lookup):
+            parts = [flat_geometry.from_shapes(shapes(master), resolution)]
+            for n, inst in enumerate(children):
+                name = inst._inst_name if inst._inst_name is not None else '#%d' % n
+                parts.append(lookup(inst.master).transformed(name, instance_transform(inst),
+                    array_offsets(inst), array_names(name, inst)))
+            return flat_geometry.concatenate(parts, resolution)
+        flat = _post_order(root, build, self._flat_memo, memoize_root=False)
+        return flat if transform == IDENTITY else flat.transformed('', transform)
+
     def get_child_instance(self, instance, inst_name):
         """
-            Find child instance from the template hierarcy using
-            DFS recursion.
+            Find child instance from the template hierarcy.
+            The hierarchy below the master of instance is indexed once
+            (see instance_index), later lookups are dictionary lookups.
             
             Parameters:
             -------
@@ -142,7 +1057,8 @@ class placement_helper():
                 to be found is the child instance of this instance)
             inst_name: String
                 Name of the instance to be found. Assumes instance name is unique
-                in the hierarcy.
+                in the hierarcy. If it is not, the first one in depth-first
+                order is returned.
 
             Returns:
             -------
@@ -151,15 +1067,19 @@ class placement_helper():
                 found.
 
         """
-        for inst in instance.master.instance_iter(): 
-            if inst._inst_name == None:
-                return None
-            elif inst._inst_name == inst_name: # Instance was found, return it
-                return inst
-            else: # Go through hierarchy, depth first
-                ret = self.get_child_instance(inst, inst_name)
-                if ret:
-                    return ret
-                else:
-                    continue
-        return None
+        return self._names_below(instance.master).get(inst_name)
+
+    def _names_below(self, top):
+        '''
+        First instance of each name below master top in depth-first order. 
+        Computed once per master with an iterative post-order walk.
+        '''
+        def build(master, children, lookup):
+            names = {}
+            for inst in children:
+                if inst._inst_name is not None:
+                    names.setdefault(inst._inst_name, inst)
+                for name, sub_inst in lookup(inst.master).items():
+                    names.setdefault(name, sub_inst)
+            return names
+        return _post_order(top, build, self._child_names)
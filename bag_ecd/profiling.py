@@ -0,0 +1,241 @@
+'''
+BAG ECD --- profiling.py
+
+Timing and memory accounting of the phases of generation.
+
+Phases are timed with phase_tracer.phase context managers, which nest, so
+that phases of sub-generators appear inside the phases of their parents.
+The collected phases can be exported in the Chrome trace event format
+(open in chrome://tracing or https://ui.perfetto.dev) and summarized as
+a table.
+
+Optionally, memory use of each phase is recorded with tracemalloc and the
+resident set size (RSS) of the process: peak traced memory during the phase,
+memory retained after it, and the source lines that allocated the most.
+Memory accounting slows down the traced program considerably.
+
+When tracing is disabled, phase returns a shared no-op context manager.
+
+'''
+import os
+import json
+import time
+import threading
+import tracemalloc
+
+def rss():
+    '''
+    Current resident set size of the process in bytes, or None if unknown.
+    '''
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss():
+    '''
+    Peak resident set size of the process in bytes, or None if unknown.
+    '''
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+class _null_phase():
+    ''' No-op phase used when tracing is disabled '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+null_phase = _null_phase()
+
+class _phase():
+    ''' Timed phase, see phase_tracer.phase '''
+    def __init__(self, tracer, name, args, memory=False):
+        self._tracer = tracer
+        self.name = name
+        self.args = args
+        self.children = 0.0
+        self.memory = memory
+
+    def __enter__(self):
+        stack = self._tracer._stack()
+        if self.memory:
+            self._enter_memory(stack)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        stack = self._tracer._stack()
+        stack.pop()
+        duration = end - self.start
+        if stack:
+            stack[-1].children += duration
+        if self.memory:
+            self._exit_memory(stack)
+        self._tracer._record(self, duration, len(stack))
+        return False
+
+    def _enter_memory(self, stack):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._tracer.memory_frames)
+        current, peak = tracemalloc.get_traced_memory()
+        # Peak of the enclosing phase up to now, before the peak is reset for this one
+        if stack and stack[-1].memory:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self.mem_start = current
+        self.peak = current
+        self.rss_start = rss()
+        self.snapshot = tracemalloc.take_snapshot() if self._tracer.memory_top > 0 else None
+
+    def _exit_memory(self, stack):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        if stack and stack[-1].memory:
+            stack[-1].peak = max(stack[-1].peak, self.peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        memory = { 'peak' : self.peak, 'peak_increase' : self.peak - self.mem_start,
+                'retained' : current - self.mem_start, 'rss_start' : self.rss_start, 
+                'rss_end' : rss(), 'peak_rss' : peak_rss() }
+        if self.snapshot is not None:
+            stats = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')
+            memory['top'] = [ '%s:%d %+d B %+d blocks' % (stat.traceback[0].filename, stat.traceback[0].lineno,
+                stat.size_diff, stat.count_diff) for stat in stats[:self._tracer.memory_top] ]
+            self.snapshot = None
+        self.args['memory'] = memory
+
+class phase_tracer():
+    '''
+    Collector of timed phases. Use the shared instance phase_tracer.tracer.
+
+    Parameters:
+
+    memory_frames : int
+        Number of stack frames stored by tracemalloc per allocation, if memory
+        accounting starts tracemalloc. Default: 1
+    memory_top : int
+        Number of top allocation sites recorded per phase. Zero disables the
+        snapshots, which are the slowest part of memory accounting. Default: 5
+
+    '''
+    def __init__(self, memory_frames=1, memory_top=5):
+        self.memory_frames = memory_frames
+        self.memory_top = memory_top
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._events = []
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @property
+    def depth(self):
+        ''' Number of open phases in the calling thread '''
+        return len(self._stack())
+
+    def phase(self, name, enabled=True, memory=False, **args):
+        '''
+        Context manager timing a phase.
+
+        Parameters:
+        -------
+        name : str
+            Name of the phase, e.g. 'instantiate_layout'
+        enabled : boolean
+            If False, returns a no-op context manager.
+        memory : boolean
+            Record also the memory use of the phase.
+        **args :
+            Additional information stored with the phase, e.g. generator name.
+        '''
+        if not enabled:
+            return null_phase
+        return _phase(self, name, args, memory)
+
+    def _record(self, phase, duration, depth):
+        event = { 'name' : phase.name, 'ph' : 'X', 'pid' : os.getpid(),
+                'tid' : threading.get_ident(), 'ts' : (phase.start - self._origin) * 1e6,
+                'dur' : duration * 1e6, 'args' : dict(phase.args, self_time=duration - phase.children,
+                    depth=depth) }
+        with self._lock:
+            self._events.append(event)
+
+    @property
+    def events(self):
+        ''' Recorded phases as Chrome trace events '''
+        return list(self._events)
+
+    def clear(self):
+        ''' Remove the recorded phases '''
+        with self._lock:
+            self._events = []
+
+    def write_chrome_trace(self, fname):
+        '''
+        Write the recorded phases to fname in the Chrome trace event JSON format.
+        '''
+        with open(fname, 'w') as f:
+            json.dump({ 'traceEvents' : self.events, 'displayTimeUnit' : 'ms' }, f)
+
+    def summary(self):
+        '''
+        Table of the recorded phases: number of calls, total, self and maximum time
+        in seconds per phase name, sorted by total time.
+        '''
+        rows = {}
+        for event in self.events:
+            row = rows.setdefault(event['name'], [ 0, 0.0, 0.0, 0.0 ])
+            row[0] += 1
+            row[1] += event['dur'] / 1e6
+            row[2] += event['args']['self_time']
+            row[3] = max(row[3], event['dur'] / 1e6)
+        lines = [ '%-28s %8s %12s %12s %12s' % ('phase', 'calls', 'total [s]', 'self [s]', 'max [s]') ]
+        for name, row in sorted(rows.items(), key=lambda item: -item[1][1]):
+            lines.append('%-28s %8d %12.4f %12.4f %12.4f' % (name, *row))
+        return '\n'.join(lines)
+
+    def memory_summary(self):
+        '''
+        Table of the memory use of the recorded phases in MiB per phase name: largest
+        peak traced memory and its increase during the phase, total retained memory
+        and largest peak RSS. Followed by the top allocation sites of the phase
+        with the largest peak increase.
+        '''
+        rows = {}
+        worst = None
+        for event in self.events:
+            memory = event['args'].get('memory')
+            if memory is None:
+                continue
+            row = rows.setdefault(event['name'], [ 0, 0, 0, 0, 0 ])
+            row[0] += 1
+            row[1] = max(row[1], memory['peak'])
+            row[2] = max(row[2], memory['peak_increase'])
+            row[3] += memory['retained']
+            row[4] = max(row[4], memory['peak_rss'] or 0)
+            if worst is None or memory['peak_increase'] > worst[1]['peak_increase']:
+                worst = (event['name'], memory)
+        mib = float(1 << 20)
+        lines = [ '%-28s %8s %12s %12s %12s %12s' % ('phase', 'calls', 'peak', 'increase', 'retained', 'peak RSS') ]
+        for name, row in sorted(rows.items(), key=lambda item: -item[1][2]):
+            lines.append('%-28s %8d %12.2f %12.2f %12.2f %12.2f' % (name, row[0], row[1] / mib,
+                row[2] / mib, row[3] / mib, row[4] / mib))
+        if worst is not None and worst[1].get('top'):
+            lines.append('Top allocation sites of %s:' % (worst[0]))
+            lines.extend('    ' + site for site in worst[1]['top'])
+        return '\n'.join(lines)
+
+phase_tracer.tracer = phase_tracer()
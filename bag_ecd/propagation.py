@@ -0,0 +1,201 @@
+'''
+BAG ECD --- propagation.py
+
+Propagation of parameters through a hierarchy of generators.
+
+A child generator copies the parameters listed in its proplist from its
+parent, renaming them with its aliases (top-level name : name in child).
+The propagation engine resolves the aliases of each child once, when it is
+registered, to the parameters of its immediate parent. Propagation follows
+the resulting chains from the changed parameters down the hierarchy,
+parents before their children, so that a value changed in a generator
+between the top level and a child reaches the child. Propagation can be
+limited to given parameters, or to the top-level parameters whose values
+changed since they were last copied.
+
+Aliases that can not be resolved are collected and reported at once.
+
+'''
+import heapq
+import threading
+from bag_ecd.fingerprint import canonical
+
+class propagation_engine():
+    '''
+    Resolved parameter mapping of a hierarchy of generators. Shared by all
+    generators of the hierarchy, see bag_design.propagation.
+
+    '''
+    def __init__(self):
+        # (id(node), attr) -> (parent node, parent attr)
+        self._sources = {}
+        # (id(source node), source attr) -> ((source node, source attr), { (id(node), attr) : (node, attr) })
+        self._targets = {}
+        # id(node) -> list of target keys (id(node), attr) of the node
+        self._registered = {}
+        # id(node) -> list of unresolved aliases of the node
+        self._unresolved = {}
+        # id(node) -> parent, id(parent) -> { id(node) : node }
+        self._parents = {}
+        self._children = {}
+        # (id(node), attr) of top-level source parameters -> canonical value last copied
+        self._applied = {}
+        self._summarized = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        ''' Number of resolved parameters '''
+        return len(self._sources)
+
+    def register(self, node, parent):
+        '''
+        Resolve the proplist and aliases of node to the parameters of parent. Registering
+        a node again replaces its previous mapping.
+
+        Returns:
+        -------
+        targets : List[Tuple[str, object, str]]
+            Resolved parameters of node: name in node, parent and name in parent.
+        '''
+        aliases = getattr(node, 'aliases', {}) or {}
+        proplist = getattr(node, 'proplist', list(aliases.keys()))
+        with self._lock:
+            self.unregister(node)
+            targets = []
+            unresolved = []
+            for prop in proplist:
+                if prop not in aliases:
+                    unresolved.append('alias for %s is not defined in %s.aliases' % (prop, type(node).__name__))
+                    continue
+                key = aliases[prop]
+                if key == 'aliases' or prop == 'aliases':
+                    raise ValueError('Cannot set aliases via proplist!')
+                if not hasattr(node, key):
+                    unresolved.append('%s does not define %s' % (type(node).__name__, key))
+                    continue
+                if not hasattr(parent, prop):
+                    unresolved.append('parent %s does not define %s' % (type(parent).__name__, prop))
+                    continue
+                source = (parent, prop)
+                self._sources[(id(node), key)] = source
+                self._targets.setdefault((id(source[0]), source[1]), (source, {}))[1][(id(node), key)] = (node, key)
+                targets.append((key, source[0], source[1]))
+            self._registered[id(node)] = [ (id(node), key) for key, source, attr in targets ]
+            self._parents[id(node)] = parent
+            self._children.setdefault(id(parent), {})[id(node)] = node
+            if unresolved:
+                self._unresolved[id(node)] = unresolved
+        return targets
+
+    def unregister(self, node):
+        ''' Remove the mapping of node '''
+        with self._lock:
+            for target in self._registered.pop(id(node), []):
+                source, attr = self._sources.pop(target)
+                entry = self._targets.get((id(source), attr))
+                if entry is not None:
+                    entry[1].pop(target, None)
+                    if not entry[1]:
+                        del self._targets[(id(source), attr)]
+                        self._applied.pop((id(source), attr), None)
+            self._unresolved.pop(id(node), None)
+            parent = self._parents.pop(id(node), None)
+            if parent is not None:
+                self._children.get(id(parent), {}).pop(id(node), None)
+
+    def children(self, node):
+        ''' Registered children of node in registration order '''
+        with self._lock:
+            return list(self._children.get(id(node), {}).values())
+
+    def apply(self, node):
+        ''' Set the resolved parameters of node from its parent '''
+        with self._lock:
+            targets = [ (key[1], self._sources[key]) for key in self._registered.get(id(node), []) ]
+        for attr, (source, source_attr) in targets:
+            value = getattr(source, source_attr)
+            setattr(node, attr, value)
+            self._record(source, source_attr, value)
+        return len(targets)
+
+    def _record(self, source, attr, value):
+        # Remember the value copied from a top-level source parameter
+        key = (id(source), attr)
+        if key not in self._sources:
+            self._applied[key] = canonical(value)
+
+    def _depth(self, node, depths):
+        # Number of registered ancestors of node, memoized in depths
+        chain = []
+        while id(node) not in depths and id(node) in self._parents:
+            chain.append(node)
+            node = self._parents[id(node)]
+        depth = depths.setdefault(id(node), 0)
+        for node in reversed(chain):
+            depth += 1
+            depths[id(node)] = depth
+        return depth
+
+    def propagate(self, names=None, source=None, changed=False):
+        '''
+        Set the parameters copied from the given source parameters, and those copied
+        from them, down the hierarchy. Parents are set before their children, and each
+        parameter is read once.
+
+        Parameters:
+        -------
+        names : Union[Iterable[str], None]
+            Propagate only the source parameters with these names, e.g. ['lch']
+            after changing lch of the top-level generator. Default: all
+        source : Union[object, None]
+            Propagate only the parameters of this source generator. Default: all
+        changed : boolean
+            Propagate only the top-level source parameters whose values changed
+            since they were last copied. Values set in the generators below are
+            kept unless the top-level value they were copied from changed.
+
+        Returns:
+        -------
+        count : int
+            Number of parameters set
+        '''
+        if names is not None:
+            names = set([names] if isinstance(names, str) else names)
+        count = 0
+        with self._lock:
+            depths = {}
+            heap = []
+            queued = set()
+            for key, ((src, attr), targets) in self._targets.items():
+                if changed and (key in self._sources or self._applied.get(key) == canonical(getattr(src, attr))):
+                    continue
+                if (names is None or attr in names) and (source is None or key[0] == id(source)):
+                    heapq.heappush(heap, (self._depth(src, depths), len(queued), src, attr))
+                    queued.add(key)
+            while heap:
+                depth, seq, src, attr = heapq.heappop(heap)
+                value = getattr(src, attr)
+                self._record(src, attr, value)
+                for key, (node, node_attr) in self._targets[(id(src), attr)][1].items():
+                    setattr(node, node_attr, value)
+                    count += 1
+                    if key in self._targets and key not in queued:
+                        heapq.heappush(heap, (depth + 1, len(queued), node, node_attr))
+                        queued.add(key)
+        return count
+
+    def unresolved(self):
+        ''' List of the unresolved aliases of all registered generators '''
+        with self._lock:
+            return [ item for items in self._unresolved.values() for item in items ]
+
+    def summary(self, new=False):
+        '''
+        One message summarizing the unresolved aliases, or None if there are none.
+        With new=True, only if there are unresolved aliases not summarized before.
+        '''
+        unresolved = self.unresolved()
+        if not unresolved or new and len(unresolved) == self._summarized:
+            return None
+        self._summarized = len(unresolved)
+        return '%d unresolved aliases, omitted:\n    %s' % (len(unresolved), '\n    '.join(unresolved))
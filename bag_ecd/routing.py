@@ -8,6 +8,9 @@ Created on 09.03.2021 by Santeri Porrasmaa, santeri.porrasmaa@aalto.fi
 
 '''
 
+from bag_ecd import bag_startup
+bag_startup.init_framework()
+
 from bag.layout.routing.base import WireArray
 from bag.layout.util import BBox 
 
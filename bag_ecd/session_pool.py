@@ -0,0 +1,121 @@
+'''
+BAG ECD --- session_pool.py
+
+Pool of BagProject sessions shared by the generators of a process.
+
+Every BagProject opens its own connection to the Virtuoso skill server.
+The pool hands out one project per endpoint, so that all generators of a
+hierarchy, and successive generate() calls, use the same warm session.
+A pooled project is health checked before it is handed out, and replaced
+if the check fails. Sessions are not shared with forked child processes.
+
+The factory creating the projects can be replaced, e.g. with one that
+connects to a local stand-in server in tests.
+
+'''
+import os
+import threading
+
+def skill_health_check(project):
+    '''
+    Default health check: evaluates a trivial skill expression through the
+    database interface of the project. Projects without a database interface
+    are considered healthy.
+    '''
+    impl_db = getattr(project, 'impl_db', None)
+    evaluate = getattr(impl_db, '_eval_skill', None)
+    if evaluate is None:
+        return True
+    try:
+        evaluate('1')
+    except Exception:
+        return False
+    return True
+
+def bag_project_factory(endpoint):
+    '''
+    Default factory: bag.BagProject(**endpoint)
+    '''
+    import bag
+    return bag.BagProject(**endpoint)
+
+class session_pool():
+    '''
+    Pool of BagProject sessions. Use the shared instance session_pool.pool.
+
+    Parameters:
+
+    factory : Callable[[Dict[str, Any]], bag.BagProject]
+        Function creating a project for an endpoint, given as keyword
+        arguments of BagProject, e.g. { 'port' : 5555 }.
+        Default: bag_project_factory
+    health_check : Callable[[bag.BagProject], bool]
+        Returns False if the project can not be used anymore.
+        Default: skill_health_check
+
+    '''
+    def __init__(self, factory=None, health_check=None):
+        self.factory = factory if factory is not None else bag_project_factory
+        self.health_check = health_check if health_check is not None else skill_health_check
+        self._sessions = {}
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(endpoint):
+        ''' Hashable key of an endpoint dictionary '''
+        return tuple(sorted((endpoint or {}).items()))
+
+    def get(self, endpoint=None):
+        '''
+        Return the project of endpoint, creating it if there is no healthy one.
+
+        Parameters:
+        -------
+        endpoint : Union[Dict[str, Any], None]
+            Keyword arguments of BagProject. Default: {}, the project configured
+            by the environment.
+        '''
+        key = self.key(endpoint)
+        with self._lock:
+            if self._pid != os.getpid(): # Forked, sessions belong to the parent
+                self._sessions = {}
+                self._pid = os.getpid()
+            project = self._sessions.get(key)
+            if project is not None and not self.health_check(project):
+                self.close(endpoint)
+                project = None
+            if project is None:
+                project = self.factory(dict(endpoint or {}))
+                self._sessions[key] = project
+            return project
+
+    def add(self, project, endpoint=None):
+        ''' Put an existing project to the pool as the session of endpoint '''
+        with self._lock:
+            self._sessions[self.key(endpoint)] = project
+
+    def close(self, endpoint=None):
+        '''
+        Remove the session of endpoint from the pool, closing its database interface.
+        '''
+        with self._lock:
+            project = self._sessions.pop(self.key(endpoint), None)
+        close = getattr(getattr(project, 'impl_db', None), 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        ''' Remove and close all sessions '''
+        with self._lock:
+            keys = list(self._sessions)
+        for key in keys:
+            self.close(dict(key))
+
+    def __len__(self):
+        return len(self._sessions)
+
+session_pool.pool = session_pool()
@@ -0,0 +1,86 @@
+'''
+BAG ECD --- yaml_cache.py
+
+Loading of YAML configuration files (e.g. bag_config.yaml, technology
+configuration) with a persistent snapshot cache.
+
+The file is parsed with the LibYAML based loader if PyYAML was built with it.
+The parsed content is pickled to a snapshot file next to the source,
+.<filename>.cache, together with the hash of the source content. Subsequent
+loads, also in other processes, unpickle the snapshot instead of parsing, as
+long as the content hash matches.
+
+Set environment variable BAG_ECD_YAML_CACHE=0 to disable the snapshots.
+
+'''
+import os
+import pickle
+import hashlib
+
+def yaml_loader():
+    '''
+    LibYAML based loader if available, pure Python loader otherwise.
+    PyYAML is imported here, as importing it is slow.
+    '''
+    import yaml
+    return getattr(yaml, 'CFullLoader', yaml.FullLoader)
+
+def snapshot_file(fname):
+    '''
+    Location of the snapshot of fname: .<basename of fname>.cache in the same directory.
+    '''
+    dirname, basename = os.path.split(os.path.abspath(fname))
+    return os.path.join(dirname, '.%s.cache' % basename)
+
+def _parse(source):
+    import yaml
+    return yaml.load(source, Loader=yaml_loader())
+
+def load_yaml(fname, cache=None):
+    '''
+    Load the content of a YAML file, reusing the snapshot of an earlier parse
+    if the file content has not changed.
+
+    Parameters:
+    -------
+    fname : str
+        YAML file to load
+    cache : Union[bool, None]
+        Use the snapshot cache. Default: True, unless environment variable
+        BAG_ECD_YAML_CACHE=0
+
+    Returns:
+    -------
+    content : Any
+        Content of the YAML file
+    '''
+    if cache is None:
+        cache = os.environ.get('BAG_ECD_YAML_CACHE', '1') != '0'
+    with open(fname, 'rb') as f:
+        source = f.read()
+    if not cache:
+        return _parse(source)
+
+    digest = hashlib.sha1(source).hexdigest()
+    snapshot = snapshot_file(fname)
+    try:
+        with open(snapshot, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['hash'] == digest:
+            return cached['content']
+    except Exception: # Missing, stale or corrupted snapshot is simply replaced
+        pass
+
+    content = _parse(source)
+    # Write atomically, concurrent processes may read the snapshot
+    tmpfile = '%s.%d.tmp' % (snapshot, os.getpid())
+    try:
+        with open(tmpfile, 'wb') as f:
+            pickle.dump({ 'hash' : digest, 'content' : content }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfile, snapshot)
+    except (OSError, pickle.PicklingError):
+        try:
+            os.remove(tmpfile)
+        except OSError:
+            pass
+    return content
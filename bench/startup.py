@@ -0,0 +1,198 @@
+'''
+BAG ECD --- bench/startup.py
+
+Start-up and import time benchmark of bag_ecd.
+
+The BAG framework is replaced by the stand-in modules in bench/stubs, so
+the benchmark runs without Virtuoso, BAG installation or technology
+files. For each requested number of generators, a synthetic BAGHOME is
+created containing a copy of bag_ecd, a bag_config.yaml and N fake
+generator packages. Then the following are timed in fresh interpreters:
+
+    import bag_ecd
+    from bag_ecd.bag_design import bag_design
+    first access of bag_design.bag_project
+    first access of bag_design.routing_grid
+
+Cold runs remove the caches of bag_ecd (generator index, YAML snapshots)
+and __pycache__ directories before every run. Warm runs reuse them.
+OS file caches are not dropped.
+
+Usage:
+
+    python bench/startup.py --generators 0,100,500 --repeat 5
+
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BENCHDIR = os.path.dirname(os.path.realpath(__file__))
+STUBDIR = os.path.join(BENCHDIR, 'stubs')
+PACKAGEDIR = os.path.join(os.path.dirname(BENCHDIR), 'bag_ecd')
+
+METRICS = [ 'import_bag_ecd', 'import_bag_design', 'bag_project', 'routing_grid' ]
+
+GENERATOR_INIT = '''import os
+from bag_ecd.bag_design import bag_design
+from %(name)s.layout import layout
+
+class %(name)s(bag_design):
+    @property
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self, *arg):
+        self.layout=layout
+'''
+
+GENERATOR_LAYOUT = '''
+class layout():
+    @classmethod
+    def get_params_info(cls):
+        return dict(lch='channel length', w='width', nf='number of fingers')
+
+    @classmethod
+    def get_default_param_values(cls):
+        return dict(nf=2)
+'''
+
+MEASURE = '''
+import time, json
+t0=time.perf_counter()
+import bag_ecd
+t1=time.perf_counter()
+from bag_ecd.bag_design import bag_design
+t2=time.perf_counter()
+import gen0_gen
+dut=gen0_gen.gen0_gen()
+t3=time.perf_counter()
+dut.bag_project
+t4=time.perf_counter()
+dut.routing_grid
+t5=time.perf_counter()
+print('BENCH ' + json.dumps(dict(import_bag_ecd=t1-t0, import_bag_design=t2-t1,
+    bag_project=t4-t3, routing_grid=t5-t4)))
+'''
+
+def make_baghome(root, ngen):
+    '''
+    Create a synthetic BAGHOME with ngen generators to root.
+    Returns the path of BAGHOME.
+    '''
+    baghome = os.path.join(root, 'BAGHOME_%d' % ngen)
+    shutil.copytree(PACKAGEDIR, os.path.join(baghome, 'bag_ecd', 'bag_ecd'),
+            ignore=shutil.ignore_patterns('__pycache__'))
+    with open(os.path.join(baghome, 'bag_config.yaml'), 'w') as f:
+        f.write('new_lib_path: BagModules\n')
+        f.write('lib_defs: bag_libs.def\n')
+        f.write('database:\n  class: bag.interface.skill.SkillInterface\n')
+        f.write('  schematic:\n    exclude_libraries: [analogLib, basic, %s]\n'
+                % ', '.join('lib%d' % i for i in range(200)))
+    # gen0_gen is always needed for the measurement
+    for i in range(max(ngen, 1)):
+        name = 'gen%d_gen' % i
+        pkgdir = os.path.join(baghome, name, name)
+        os.makedirs(pkgdir)
+        with open(os.path.join(pkgdir, '__init__.py'), 'w') as f:
+            f.write(GENERATOR_INIT % { 'name' : name })
+        with open(os.path.join(pkgdir, 'layout.py'), 'w') as f:
+            f.write(GENERATOR_LAYOUT)
+    # Some non-generator content
+    os.makedirs(os.path.join(baghome, 'BagModules'))
+    os.makedirs(os.path.join(baghome, 'run_dir'))
+    return baghome
+
+def clear_caches(baghome):
+    '''
+    Remove the persistent caches and byte code of bag_ecd and the generators.
+    '''
+    for dirpath, dirnames, filenames in os.walk(baghome):
+        if '__pycache__' in dirnames:
+            shutil.rmtree(os.path.join(dirpath, '__pycache__'))
+            dirnames.remove('__pycache__')
+        for fname in filenames:
+            if fname.endswith('.cache') or fname == '.bag_ecd_generators.json':
+                os.remove(os.path.join(dirpath, fname))
+
+def measure(baghome, lazy=False):
+    '''
+    Run the measurement in a fresh interpreter. Returns the dictionary of timings.
+    '''
+    env = dict(os.environ)
+    env.update({
+        'BAG_FRAMEWORK' : STUBDIR,
+        'BAG_TECH_CONFIG_DIR' : STUBDIR,
+        'BAG_WORK_DIR' : baghome,
+        'PYTHONPATH' : os.path.join(baghome, 'bag_ecd'),
+        'BAG_ECD_LAZY' : '1' if lazy else '0',
+        })
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', MEASURE], cwd=baghome, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    total = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError('Measurement failed:\n%s' % proc.stderr)
+    for line in proc.stdout.splitlines():
+        if line.startswith('BENCH '):
+            result = json.loads(line[len('BENCH '):])
+            result['interpreter'] = total
+            return result
+    raise RuntimeError('Measurement printed no result:\n%s' % proc.stdout)
+
+def run(generators, repeat, lazy=False):
+    '''
+    Run the benchmark. Returns list of result rows.
+    '''
+    rows = []
+    root = tempfile.mkdtemp(prefix='bag_ecd_bench_')
+    try:
+        for ngen in generators:
+            baghome = make_baghome(root, ngen)
+            for mode in [ 'cold', 'warm' ]:
+                samples = []
+                if mode == 'warm':
+                    measure(baghome, lazy) # Populate the caches
+                for i in range(repeat):
+                    if mode == 'cold':
+                        clear_caches(baghome)
+                    samples.append(measure(baghome, lazy))
+                row = { 'generators' : ngen, 'mode' : mode }
+                for key in METRICS + [ 'interpreter' ]:
+                    row[key] = statistics.median([ s[key] for s in samples ])
+                rows.append(row)
+            shutil.rmtree(baghome)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return rows
+
+def report(rows):
+    '''
+    Format the result rows as a table. Times are in milliseconds.
+    '''
+    columns = [ 'generators', 'mode' ] + METRICS + [ 'interpreter' ]
+    lines = [ ' '.join('%18s' % c for c in columns) ]
+    for row in rows:
+        lines.append(' '.join([ '%18d' % row['generators'], '%18s' % row['mode'] ]
+            + [ '%18.2f' % (row[key] * 1e3) for key in columns[2:] ]))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark bag_ecd start-up with a stubbed BAG framework')
+    parser.add_argument('--generators', default='0,10,100,500',
+            help='Comma separated list of generator counts in BAGHOME (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (default: %(default)s)')
+    parser.add_argument('--lazy', action='store_true', help='Measure with BAG_ECD_LAZY=1')
+    parser.add_argument('--json', default=None, help='Write the results also to this JSON file')
+    args = parser.parse_args()
+    rows = run([ int(n) for n in args.generators.split(',') ], args.repeat, args.lazy)
+    print(report(rows))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=4)
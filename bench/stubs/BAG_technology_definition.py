@@ -0,0 +1,15 @@
+'''
+Stand-in for the process specific BAG_technology_definition used by the
+bag_ecd benchmarks.
+
+'''
+
+class BAG_technology_definition():
+    ''' Routing grid options of a fictional process '''
+    grid_opts = {
+        'layers' : [1, 2, 3, 4, 5, 6],
+        'spaces' : [0.1, 0.1, 0.1, 0.1, 0.2, 0.2],
+        'widths' : [0.1, 0.1, 0.1, 0.1, 0.2, 0.2],
+        'bot_dir' : 'y',
+        'width_override' : {},
+    }
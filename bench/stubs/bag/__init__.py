@@ -0,0 +1,65 @@
+'''
+Stand-in for the BAG framework package used by the bag_ecd benchmarks.
+
+Provides only the names bag_ecd uses, with negligible construction cost,
+so that the measured times are those of bag_ecd itself.
+
+'''
+import time
+
+#Simulated BagProject start-up latency in seconds, set by the benchmark
+STARTUP_DELAY = 0.0
+
+class TechInfo():
+    ''' Stand-in for bag.layout.core.TechInfo '''
+    def __init__(self, resolution=0.001):
+        self.resolution = resolution
+
+class BagProject():
+    ''' Stand-in for bag.BagProject '''
+    def __init__(self, bag_config_path=None, port=None):
+        if STARTUP_DELAY:
+            time.sleep(STARTUP_DELAY)
+        self.bag_config = { 'new_lib_path' : 'BagModules' }
+        self.tech_info = TechInfo()
+
+    def import_design_library(self, lib_name):
+        pass
+
+    def create_design_module(self, lib_name, cell_name, **kwargs):
+        if not hasattr(self, 'dsn_db'):
+            self.dsn_db = ModuleDB(self)
+        return DesignModule(self.dsn_db, lib_name, cell_name)
+
+    def instantiate_layout(self, lib_name, view_name, via_tech, layout_list):
+        self.layouts = getattr(self, 'layouts', [])
+        self.layouts.append((lib_name, layout_list))
+
+    def instantiate_schematic(self, lib_name, content_list, lib_path=''):
+        self.schematics = getattr(self, 'schematics', [])
+        self.schematics.append((lib_name, content_list))
+
+class ModuleDB():
+    ''' Stand-in for bag.design.module.ModuleDB '''
+    def __init__(self, prj):
+        self._prj = prj
+
+    def instantiate_masters(self, master_list, name_list=None, lib_name='', debug=False, rename_dict=None):
+        if name_list is None:
+            name_list = [ master.cell_name for master in master_list ]
+        self._prj.instantiate_schematic(lib_name, [ (name, dict(master.params))
+            for name, master in zip(name_list, master_list) ])
+
+class DesignModule():
+    ''' Stand-in for the schematic generator module returned by create_design_module '''
+    def __init__(self, master_db, lib_name, cell_name):
+        self.master_db = master_db
+        self.lib_name = lib_name
+        self.cell_name = cell_name
+        self.params = {}
+
+    def design(self, **kwargs):
+        self.params = kwargs
+
+    def implement_design(self, lib_name, top_cell_name='', **kwargs):
+        self.master_db.instantiate_masters([self], [top_cell_name], lib_name=lib_name)
@@ -0,0 +1,9 @@
+'''
+Stand-in for bag.design used by the bag_ecd benchmarks.
+
+'''
+
+class Module():
+    ''' Stand-in for bag.design.Module '''
+    def __init__(self, database, yaml_file, **kwargs):
+        self.params = kwargs
@@ -0,0 +1,5 @@
+'''
+Stand-in for bag.design.module used by the bag_ecd benchmarks.
+
+'''
+from bag.design import Module
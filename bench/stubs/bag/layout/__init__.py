@@ -0,0 +1,48 @@
+'''
+Stand-in for bag.layout used by the bag_ecd benchmarks.
+
+'''
+
+class RoutingGrid():
+    ''' Stand-in for bag.layout.routing.RoutingGrid '''
+    def __init__(self, tech_info, layers, spaces, widths, bot_dir, max_num_tr=None, width_override=None):
+        self.tech_info = tech_info
+        self.resolution = tech_info.resolution
+        self.layers = list(layers)
+        self.sp_tracks = dict(zip(layers, spaces))
+        self.w_tracks = dict(zip(layers, widths))
+        self.dir_tracks = {}
+        direction = bot_dir
+        for lay in layers:
+            self.dir_tracks[lay] = direction
+            direction = 'y' if direction == 'x' else 'x'
+        self.width_override = width_override
+
+class Template():
+    ''' Stand-in for a layout template created by TemplateDB '''
+    def __init__(self, temp_db, params):
+        self.template_db = temp_db
+        self.params = params
+        self.sch_params = dict(params)
+
+class TemplateDB():
+    ''' Stand-in for bag.layout.template.TemplateDB '''
+    def __init__(self, lib_defs, routing_grid, lib_name, prj=None, use_cybagoa=False, **kwargs):
+        self.grid = routing_grid
+        self.lib_name = lib_name
+        self._masters = {}
+
+    def new_template(self, params=None, temp_cls=None, debug=False, **kwargs):
+        key = (temp_cls, repr(sorted((params or {}).items())))
+        if key not in self._masters:
+            self._masters[key] = Template(self, dict(params or {}))
+        return self._masters[key]
+
+    def batch_layout(self, prj, template_list, name_list=None, lib_name='', debug=False, rename_dict=None):
+        if name_list is None:
+            name_list = [ None ] * len(template_list)
+        prj.instantiate_layout(lib_name or self.lib_name, 'layout', 'via_tech',
+                [ (name, temp.params) for name, temp in zip(name_list, template_list) ])
+
+    def instantiate_layout(self, prj, template, top_cell_name=None, debug=False, rename_dict=None):
+        self.batch_layout(prj, [template], [top_cell_name], debug=debug, rename_dict=rename_dict)
@@ -0,0 +1,5 @@
+'''
+Stand-in for bag.layout.routing used by the bag_ecd benchmarks.
+
+'''
+from bag.layout import RoutingGrid
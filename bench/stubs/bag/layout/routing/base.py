@@ -0,0 +1,8 @@
+'''
+Stand-in for bag.layout.routing.base used by the bag_ecd benchmarks.
+
+'''
+
+class WireArray():
+    ''' Stand-in for bag.layout.routing.base.WireArray '''
+    pass
@@ -0,0 +1,8 @@
+'''
+Stand-in for bag.layout.util used by the bag_ecd benchmarks.
+
+'''
+
+class BBox():
+    ''' Stand-in for bag.layout.util.BBox '''
+    pass
@@ -0,0 +1,7 @@
+'''
+Stand-in for bag.math used by the bag_ecd benchmarks.
+
+'''
+
+def float_to_si_string(num, precision=6):
+    return '%.*g' % (precision, num)